@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Bernard Yue
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Declaration serializing of CSSBeautifier._serializeDeclarations,
+concatenating strings and serializing every token twice (the old
+behaviour) against the list buffer, on token heavy rules: large custom
+property blocks and long grid-template values.
+
+Usage: python benchmark/bench_cssdeclarations.py [number-of-declarations]
+"""
+from __future__ import unicode_literals, absolute_import, print_function
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                os.pardir)))
+
+import tinycss2                                         # noqa: E402
+from html5print import CSSBeautifier                    # noqa: E402
+from html5print.cssprint import PARSER_FLAGS            # noqa: E402
+
+
+def customProperties(number):
+    return ':root {{ {0} }}'.format(' '.join(
+        '--v{0}: calc(var(--v{1}) * 2px + {0}%) {0}px;'.format(i, i // 2)
+        for i in range(number)))
+
+
+def gridTemplate(number):
+    return '.grid {{ grid-template-areas: {0}; color: red; }}'.format(' '.join(
+        '"a{0} b{0} c{0}"'.format(i) for i in range(number)) + ' ' + ' '.join(
+        '[l{0}] {0}fr'.format(i) for i in range(number)))
+
+
+def oldSerializeDeclarations(cbb, indent=2):
+    """CSSBeautifier._serializeDeclarations as it was before the list
+    buffer"""
+    contents = []
+    content = ''
+    entityEnded = False
+    ns = tinycss2.ast
+    cbb.content = CSSBeautifier._stripAST(cbb.content)
+
+    for node in cbb.content:
+        if node.serialize() == ';':
+            entityEnded = True
+        if entityEnded and isinstance(node, ns.IdentToken):
+            contents.append(content.rstrip())
+            entityEnded = False
+            content = node.serialize()
+        else:
+            content += node.serialize()
+    contents.append(content)
+
+    for c, i in zip(contents, range(len(contents))):
+        if ':' in c and '::' not in c:
+            p, v = c.split(':', 1)
+            contents[i] = '{0:<20}: {1}'.format(p, v.lstrip())
+    return os.linesep.join(' ' * indent + c for c in contents)
+
+
+def main(number):
+    for case, css in (('custom properties', customProperties(number)),
+                      ('grid template', gridTemplate(number))):
+        cbb = tinycss2.parse_component_value_list(css, **PARSER_FLAGS)[-1]
+        assert oldSerializeDeclarations(cbb) == \
+            CSSBeautifier._serializeDeclarations(cbb)
+        print('{0}, {1} tokens'.format(case, len(cbb.content)))
+        for name, func in (('old', oldSerializeDeclarations),
+                           ('list buffer',
+                            CSSBeautifier._serializeDeclarations)):
+            seconds = min(timeit.repeat(lambda: func(cbb), number=1,
+                                        repeat=5))
+            print('  {0:<12}: {1:8.3f} ms'.format(name, seconds * 1000))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Bernard Yue
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Stress test of deeply nested @supports / @media / @layer rules:
+CSSBeautifier._serializeCSSRule recursing per nested at-rule and
+re-indenting the lines of every child once per level (the old behaviour)
+against the single pass with an explicit stack.
+
+Usage: python benchmark/bench_cssnesting.py [depth [rules-per-level]]
+"""
+from __future__ import unicode_literals, absolute_import, print_function
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                os.pardir)))
+
+import tinycss2                                         # noqa: E402
+from html5print import CSSBeautifier                    # noqa: E402
+from html5print.cssprint import PARSER_FLAGS            # noqa: E402
+
+AT_RULES = ('@supports (display: grid)', '@media (min-width: {0}px)',
+            '@layer l{0}')
+
+
+def nested(depth, rules):
+    """css with at-rules nested `depth` levels, `rules` rules per level"""
+    pieces = []
+    for level in range(depth):
+        pieces.append(AT_RULES[level % 3].format(level * 10) + ' {\n')
+        pieces.extend('.c{0}-{1} {{ margin: {1}px; color: red; }}\n'.format(
+                      level, i) for i in range(rules))
+    pieces.append('}\n' * depth)
+    return ''.join(pieces)
+
+
+def oldSerializeCSSRule(ast, indent=2):
+    """CSSBeautifier._serializeCSSRule as it was before the explicit
+    stack"""
+    selector = CSSBeautifier._serializeSelector(ast)
+    if selector[0] == '@':
+        parsed = []
+        for a, isCSSRule in CSSBeautifier._getCSSObjects(ast[-1].content):
+            if isCSSRule:
+                text = oldSerializeCSSRule(a, indent)
+            else:
+                text = CSSBeautifier._serializeComments(a)
+            if text:
+                parsed.extend(text.split(os.linesep))
+        parsed = (' ' * indent + p for p in parsed)
+        declarations = os.linesep.join(parsed)
+    else:
+        declarations = CSSBeautifier._serializeDeclarations(ast[-1], indent)
+    return os.linesep.join((selector + '{', declarations, '}'))
+
+
+def main(depth, rules):
+    css = nested(depth, rules)
+    ast = tinycss2.parse_component_value_list(css, **PARSER_FLAGS)
+    rule = next(a for a, isCSSRule in CSSBeautifier._getCSSObjects(ast)
+                if isCSSRule)
+    assert oldSerializeCSSRule(rule) == CSSBeautifier._serializeCSSRule(rule)
+    print('{0} levels, {1} rules per level, {2} bytes'.format(
+          depth, rules, len(css)))
+    for name, func in (('recursive', oldSerializeCSSRule),
+                       ('stack', CSSBeautifier._serializeCSSRule)):
+        seconds = min(timeit.repeat(lambda: func(rule), number=1, repeat=5))
+        print('  {0:<10}: {1:8.3f} ms'.format(name, seconds * 1000))
+    for engine in CSSBeautifier.engines:
+        seconds = min(timeit.repeat(
+            lambda: CSSBeautifier.beautify(css, engine=engine), number=1,
+            repeat=3))
+        print('  beautify, engine {0:<10}: {1:8.3f} ms'.format(
+              engine, seconds * 1000))
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:3]]
+    main(*(args + [20, 200][len(args):]))
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Bernard Yue
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Selector start detection of CSSBeautifier._foundSelector, building a
+list of token types and serializing literals per node (the old behaviour)
+against the lookup in precomputed sets, over the top level nodes of a
+stylesheet.
+
+Usage: python benchmark/bench_cssselector.py [number-of-rules]
+"""
+from __future__ import unicode_literals, absolute_import, print_function
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                os.pardir)))
+
+import tinycss2                                         # noqa: E402
+from html5print import CSSBeautifier                    # noqa: E402
+from html5print.cssprint import PARSER_FLAGS            # noqa: E402
+
+RULE = ('/* rule {0} */ .c{0} > p.x, #id{0} a:hover, *::after '
+        '{{ color: red; margin: 0; }}\n')
+
+
+def oldFoundSelector(node):
+    """CSSBeautifier._foundSelector as it was before the lookup sets"""
+    ns = tinycss2.ast
+    found = False
+    stypes = [ns.HashToken, ns.IdentToken, ns.AtKeywordToken]
+    if sum(map(isinstance, [node] * len(stypes), stypes)):
+        found = True
+    elif isinstance(node, ns.LiteralToken) and node.serialize() in '.*:':
+        found = True
+    return found
+
+
+def main(number):
+    css = ''.join(RULE.format(i) for i in range(number))
+    ast = tinycss2.parse_component_value_list(css, **PARSER_FLAGS)
+    old = [oldFoundSelector(node) for node in ast]
+    assert old == [CSSBeautifier._foundSelector(node) for node in ast]
+    for name, func in (('old', oldFoundSelector),
+                       ('lookup sets', CSSBeautifier._foundSelector)):
+        seconds = min(timeit.repeat(lambda: [func(node) for node in ast],
+                                    number=1, repeat=5))
+        print('{0:<12}: {1:8.3f} ms per {2} nodes, {3:6.1f} ns per node'
+              .format(name, seconds * 1000, len(ast),
+                      seconds * 1e9 / len(ast)))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Bernard Yue
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Import time of the package, each beautifier and ``html5-print --version``
+measured in fresh interpreters.  The best of several runs is reported, the
+interpreter start up time is subtracted.
+
+Usage: python benchmark/bench_import.py [runs]
+"""
+from __future__ import unicode_literals, absolute_import, print_function
+
+import os
+import sys
+import subprocess
+import timeit
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+CASES = [
+    ('python (baseline)', ['-c', 'pass']),
+    ('import html5print', ['-c', 'import html5print']),
+    ('CSSBeautifier', ['-c', 'from html5print import CSSBeautifier']),
+    ('JSBeautifier', ['-c', 'from html5print import JSBeautifier']),
+    ('HTMLBeautifier', ['-c', 'from html5print import HTMLBeautifier']),
+    ('html5-print --version', [os.path.join(ROOT, 'html5-print'),
+                               '--version']),
+]
+
+
+def best(args, runs):
+    """best wall time in seconds of running python with `args`"""
+    with open(os.devnull, 'w') as devnull:
+        def run():
+            subprocess.check_call([sys.executable] + args, cwd=ROOT,
+                                  stdout=devnull, stderr=devnull)
+        return min(timeit.repeat(run, number=1, repeat=runs))
+
+
+def main(runs):
+    baseline = None
+    for name, args in CASES:
+        seconds = best(args, runs)
+        if baseline is None:
+            baseline = seconds
+            print('{0:<22}: {1:8.1f} ms'.format(name, seconds * 1000))
+        else:
+            print('{0:<22}: {1:8.1f} ms'.format(
+                  name, (seconds - baseline) * 1000))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Bernard Yue
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Per-script overhead of JSBeautifier.beautify with a fresh slimit parser
+per call (the old behaviour) against the cached per-thread parser.
+
+Usage: python benchmark/bench_jsparser.py [number-of-scripts]
+"""
+from __future__ import unicode_literals, absolute_import, print_function
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                os.pardir)))
+
+import slimit                                           # noqa: E402
+from html5print import JSBeautifier                     # noqa: E402
+
+SCRIPT = '''function myFunction() {
+document.getElementById("demo").innerHTML = "Paragraph changed.";
+}'''
+
+
+def freshParser(js, indent=2):
+    """JSBeautifier.beautify as it was before the parser cache"""
+    tree = slimit.parser.Parser().parse(js)
+    return JSBeautifier._reindenting(tree.to_ecma(), indent)
+
+
+def main(number):
+    JSBeautifier.beautify(SCRIPT)       # warm up the cached parser
+    for name, func in (('fresh parser', freshParser),
+                       ('cached parser', JSBeautifier.beautify)):
+        seconds = timeit.timeit(lambda: func(SCRIPT), number=number)
+        print('{0:<15}: {1:8.3f} ms per script ({2} scripts)'.format(
+              name, seconds * 1000 / number, number))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
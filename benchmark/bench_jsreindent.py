@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Bernard Yue
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Hand-formatted javascript with wrong indentation: JSBeautifier.beautify
+parsing it with slimit and regenerating it (mode "parse") against
+re-indenting its lines by their brackets (mode "reindent").
+
+Usage: python benchmark/bench_jsreindent.py [number-of-functions]
+"""
+from __future__ import unicode_literals, absolute_import, print_function
+
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                os.pardir)))
+
+from html5print import JSBeautifier                     # noqa: E402
+
+FUNCTION = '''// handler {0}
+function handler{0}(event, options) {{
+var target = event.target || options.fallback;
+    if (!target) {{
+  return null;
+        }}
+/* collect the
+   matching items */
+  var items = options.items.filter(function(item) {{
+      return item.id === {0} && /[a-z]+/.test(item.name);
+  }});
+return {{ target: target, count: items.length }};
+}}
+'''
+
+
+def script(functions):
+    """javascript of `functions` copies of the badly indented FUNCTION"""
+    return ''.join(FUNCTION.format(i) for i in range(functions))
+
+
+def main(functions):
+    js = script(functions)
+    reindented = JSBeautifier.beautify(js, mode='reindent')
+    assert re.sub(r'\s', '', reindented) == re.sub(r'\s', '', js)
+    JSBeautifier.beautify(js)           # warm up the cached parser
+    print('{0} functions, {1} bytes'.format(functions, len(js)))
+    for mode in JSBeautifier.modes:
+        seconds = min(timeit.repeat(
+            lambda: JSBeautifier.beautify(js, mode=mode),
+            number=1, repeat=3))
+        print('{0:<10}: {1:8.1f} ms'.format(mode, seconds * 1000))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
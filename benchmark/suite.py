@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Bernard Yue
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Benchmark suite of the HTML, CSS and Javascript beautifiers on synthetic
+corpora: small fragments, large pages, deeply nested @media rules, token
+heavy declaration blocks, minified Javascript and documents in mixed
+encodings.  For each case it reports throughput, latency percentiles of a
+call and peak memory (traced in a separate call, so tracing does not slow
+down the timed calls).
+
+Results can be saved as JSON and later runs compared against them; the
+comparison exits with status 1 if a case got slower by more than the
+threshold.
+
+Usage: python benchmark/suite.py [-k NAME] [-n REPEAT] [--scale SCALE]
+                                 [--save FILE] [--compare FILE]
+                                 [--threshold PERCENT]
+"""
+from __future__ import unicode_literals, absolute_import, print_function
+
+import collections
+import os
+import sys
+import json
+import random
+import platform
+import argparse
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                os.pardir)))
+
+import html5print                                       # noqa: E402
+from html5print import (CSSBeautifier, JSBeautifier,    # noqa: E402
+                        HTMLBeautifier, decodeText)
+
+try:
+    import tracemalloc
+except ImportError:             # python 2
+    tracemalloc = None
+
+WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do '
+         'eiusmod tempor incididunt ut labore et dolore magna aliqua').split()
+
+
+def words(rnd, n):
+    return ' '.join(rnd.choice(WORDS) for i in range(n))
+
+
+def cssRule(rnd, i):
+    return ('.c{0} > p.x{1}, #id{0} a:hover {{ color: #{2:06x}; '
+            'margin: {3}px {4}px; font: 12px/1.5 "Helvetica", sans-serif; '
+            'background: url("img/{0}.png") no-repeat; }}\n').format(
+                i, rnd.randint(0, 99), rnd.randint(0, 0xffffff),
+                rnd.randint(0, 20), rnd.randint(0, 20))
+
+
+def jsFunction(rnd, i):
+    return ('function f{0}(a, b) {{ var x = a + b * {1}; '
+            'if (x > {2}) {{ return [x, "{3}"]; }} '
+            'for (var i = 0; i < b; i++) {{ x += i; }} '
+            'return {{k: x, s: "{3}"}}; }}\n').format(
+                i, rnd.randint(1, 9), rnd.randint(10, 99), words(rnd, 3))
+
+
+def htmlPage(rnd, size):
+    """html page of about `size` characters with embedded css and js"""
+    head = ['<!DOCTYPE html><html><head><meta charset="utf-8">'
+            '<title>', words(rnd, 5), '</title><style>']
+    head.extend(cssRule(rnd, i) for i in range(20))
+    head.append('</style><script>')
+    head.extend(jsFunction(rnd, i) for i in range(10))
+    head.append('</script></head><body>')
+    pieces, length, i = head, sum(len(p) for p in head), 0
+    while length < size:
+        block = ('<div class="c{0}"><h2 id="h{0}">{1}</h2>'
+                 '<p>{2} <a href="/p/{0}">{3}</a> <b>{4}</b></p>'
+                 '<ul><li>{3}</li><li>{4}<br>{1}</li></ul>'
+                 '<img src="i{0}.png" alt="{3}"></div>\n').format(
+                     i, words(rnd, 4), words(rnd, 30), words(rnd, 2),
+                     words(rnd, 3))
+        pieces.append(block)
+        length += len(block)
+        i += 1
+    pieces.append('</body></html>')
+    return ''.join(pieces)
+
+
+def nestedMedia(rnd, depth, rules):
+    """css with @media / @supports nested `depth` levels"""
+    pieces = []
+    for level in range(depth):
+        pieces.append('@media (min-width: {0}px) {{\n'.format(level * 10))
+        pieces.extend(cssRule(rnd, level * rules + i) for i in range(rules))
+    pieces.append('}\n' * depth)
+    return ''.join(pieces)
+
+
+def customProperties(rnd, n):
+    """css rule with `n` custom properties of a few tokens each"""
+    return ':root {{\n{0}}}\n'.format(''.join(
+        '  --v{0}: calc(var(--v{1}) * {2}px + {0}%) #{3:06x};\n'.format(
+            i, i // 2, rnd.randint(1, 9), rnd.randint(0, 0xffffff))
+        for i in range(n)))
+
+
+def minifiedJS(rnd, size):
+    """minified javascript of about `size` characters"""
+    pieces, length, i = [], 0, 0
+    while length < size:
+        f = jsFunction(rnd, i).replace('\n', '')
+        for a, b in ((' = ', '='), (' + ', '+'), (' * ', '*'), ('; ', ';'),
+                     (' { ', '{'), (' } ', '}'), (', ', ',')):
+            f = f.replace(a, b)
+        pieces.append(f)
+        length += len(f)
+        i += 1
+    return ''.join(pieces)
+
+
+def encodedPages(rnd, n):
+    """html documents as bytes in different encodings, declared or not"""
+    texts = [('utf-8', 'Ceci est un café, déjà vu, naïve'),
+             ('cp1252', 'Ceci est un café, déjà vu, naïve “quoted”'),
+             ('iso-8859-7', 'Καλημέρα κόσμε, αυτή είναι μια δοκιμή'),
+             ('shift_jis', 'こんにちは世界、これはテストです'),
+             ('gb18030', '你好世界，这是一个测试'),
+             ('utf-16', 'Hello world, with BOM')]
+    docs = []
+    for i in range(n):
+        encoding, text = texts[i % len(texts)]
+        meta = ('<meta charset="{0}">'.format(encoding) if i % 2 and
+                not encoding.startswith('utf-16') else '')
+        html = ('<html><head>{0}<title>{1}</title></head><body>{2}'
+                '</body></html>').format(meta, text, ''.join(
+                    '<p>{0} {1}</p>'.format(text, words(rnd, 10))
+                    for j in range(20)))
+        docs.append(html.encode(encoding))
+    return docs
+
+
+def corpora(scale=1.0):
+    """list of (name, function, list of inputs).  Inputs are generated from
+    a fixed seed so runs are comparable."""
+    rnd = random.Random(1234)
+
+    def n(x):
+        return max(1, int(x * scale))
+
+    fragments = ['<p class="a">{0} <b>{1}</b><br>{0}</p>'.format(
+                 words(rnd, 8), words(rnd, 2)) for i in range(20)]
+    return [
+        ('html-fragment', HTMLBeautifier.beautify, fragments),
+        ('html-page-1mb', HTMLBeautifier.beautify,
+         [htmlPage(rnd, n(1024 * 1024))]),
+        ('html-page-1mb-auto',
+         lambda html: HTMLBeautifier.beautify(html, parser='auto'),
+         [htmlPage(rnd, n(1024 * 1024))]),
+        ('css-rules', CSSBeautifier.beautify,
+         [''.join(cssRule(rnd, i) for i in range(n(2000)))]),
+        ('css-rules-structured',
+         lambda css: CSSBeautifier.beautify(css, engine='structured'),
+         [''.join(cssRule(rnd, i) for i in range(n(2000)))]),
+        ('css-nested-media', CSSBeautifier.beautify,
+         [nestedMedia(rnd, 20, n(20))]),
+        ('css-custom-props', CSSBeautifier.beautify,
+         [customProperties(rnd, n(5000))]),
+        ('js-small', JSBeautifier.beautify,
+         [jsFunction(rnd, i) for i in range(20)]),
+        ('js-minified', JSBeautifier.beautify, [minifiedJS(rnd, n(100000))]),
+        ('js-minified-stream',
+         lambda js: collections.deque(JSBeautifier.beautifyIter(js), 0),
+         [minifiedJS(rnd, n(100000))]),
+        ('decode-mixed', decodeText, encodedPages(rnd, n(60))),
+        ('html-mixed-encoding', HTMLBeautifier.beautify,
+         encodedPages(rnd, n(12))),
+    ]
+
+
+def percentile(values, pct):
+    """nearest rank percentile of sorted `values`"""
+    index = max(0, int(round(pct / 100.0 * len(values) + 0.5)) - 1)
+    return values[min(index, len(values) - 1)]
+
+
+def size(data):
+    return len(data if isinstance(data, bytes) else data.encode('utf-8'))
+
+
+def peakMemory(func, inputs):
+    """peak traced memory in bytes of one call per input"""
+    if tracemalloc is None:
+        return None
+    peak = 0
+    for data in inputs:
+        tracemalloc.start()
+        try:
+            func(data)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+    return peak
+
+
+def runCase(func, inputs, repeat):
+    """time `func` over `inputs`, `repeat` rounds after a warm up round"""
+    for data in inputs:
+        func(data)                  # warm up parsers and imports
+    latencies = []
+    timer = timeit.default_timer
+    for r in range(repeat):
+        for data in inputs:
+            start = timer()
+            func(data)
+            latencies.append(timer() - start)
+    latencies.sort()
+    total = sum(latencies)
+    nbytes = sum(size(d) for d in inputs) * repeat
+    return dict(calls=len(latencies), bytes=nbytes,
+                mbps=nbytes / total / 1e6 if total else 0.0,
+                p50=percentile(latencies, 50), p90=percentile(latencies, 90),
+                p99=percentile(latencies, 99),
+                peak=peakMemory(func, inputs))
+
+
+def formatResult(name, result):
+    peak = result['peak']
+    return ('{0:<21} {1:>9.2f} {2:>10.3f} {3:>10.3f} {4:>10.3f} {5:>9}'
+            .format(name, result['mbps'], result['p50'] * 1000,
+                    result['p90'] * 1000, result['p99'] * 1000,
+                    formatBytes(peak)))
+
+
+def formatBytes(n):
+    if n is None:
+        return '-'
+    if n < 1048576:
+        return '{0:.0f}K'.format(n / 1024.0)
+    return '{0:.1f}M'.format(n / 1048576.0)
+
+
+def compare(results, baseline, threshold):
+    """print change of each case against `baseline`
+    :return : list of names of cases slower than `threshold` percent"""
+    regressions = []
+    print()
+    print('{0:<20} {1:>12} {2:>12} {3:>12}'.format(
+          'vs baseline', 'p50', 'MB/s', 'peak'))
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print('{0:<20} {1:>12}'.format(name, 'new'))
+            continue
+
+        def change(key):
+            if not base.get(key) or result.get(key) is None:
+                return None
+            return (result[key] - base[key]) * 100.0 / base[key]
+
+        changes = [change('p50'), change('mbps'), change('peak')]
+        print('{0:<20} {1:>12} {2:>12} {3:>12}'.format(name, *[
+              '-' if c is None else '{0:+.1f}%'.format(c) for c in changes]))
+        if changes[0] is not None and changes[0] > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def parseArgs(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-k', dest='keyword', default='',
+                        help='only run cases whose name contains KEYWORD')
+    parser.add_argument('-n', '--repeat', type=int, default=5,
+                        help='timed rounds per case, default 5')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='multiply size of large inputs, default 1.0')
+    parser.add_argument('--save', metavar='FILE',
+                        help='save results as json to FILE')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='compare results with baseline saved in FILE')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='percent p50 latency may grow before a case is'
+                        ' a regression, default 10')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parseArgs(argv)
+    results = {}
+    print('{0:<21} {1:>9} {2:>10} {3:>10} {4:>10} {5:>9}'.format(
+          'case', 'MB/s', 'p50 ms', 'p90 ms', 'p99 ms', 'peak'))
+    for name, func, inputs in corpora(args.scale):
+        if args.keyword not in name:
+            continue
+        results[name] = runCase(func, inputs, args.repeat)
+        print(formatResult(name, results[name]))
+        sys.stdout.flush()
+    if args.save:
+        with open(args.save, 'w') as fh:
+            json.dump(dict(version=html5print.__version__,
+                           python=platform.python_version(),
+                           platform=platform.platform(),
+                           scale=args.scale, results=results),
+                      fh, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+        if baseline.get('scale') != args.scale:
+            print('warning: baseline was run with --scale {0}'.format(
+                  baseline.get('scale')))
+        regressions = compare(results, baseline['results'], args.threshold)
+        if regressions:
+            print('slower than baseline: ' + ', '.join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -16,10 +16,43 @@
 #
 from __future__ import unicode_literals, absolute_import
 
-from .cssprint import CSSBeautifier
-from .jsprint import JSBeautifier
-from .html5print import HTMLBeautifier
-from .utils import decodeText, isUnicode
+import sys
+import importlib
+
+# public names and the submodule defining them.  Submodules are imported on
+# first access so that e.g. ``from html5print import CSSBeautifier`` does not
+# pay for loading html5lib and the Javascript parser
+_lazyNames = {
+    'CSSBeautifier': '.cssprint',
+    'JSBeautifier': '.jsprint',
+    'HTMLBeautifier': '.html5print',
+    'decodeText': '.utils',
+    'isUnicode': '.utils',
+    'ResultCache': '.cache',
+    'Stats': '.stats',
+}
+
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        try:
+            module = _lazyNames[name]
+        except KeyError:
+            raise AttributeError('module {0!r} has no attribute '
+                                 '{1!r}'.format(__name__, name))
+        value = getattr(importlib.import_module(module, __name__), name)
+        globals()[name] = value
+        return value
+
+    def __dir__():
+        return sorted(set(globals()) | set(_lazyNames))
+else:
+    # no module level __getattr__ (PEP 562), import everything
+    from .cssprint import CSSBeautifier
+    from .jsprint import JSBeautifier
+    from .html5print import HTMLBeautifier
+    from .utils import decodeText, isUnicode
+    from .cache import ResultCache
+    from .stats import Stats
 
 __version__ = '0.1.2'
 __author__ = 'Bernard Yue'
@@ -93,27 +126,67 @@ Synopsis
 .. code-block:: sh
 
     $ html5-print --help
-    usage: html5-print [-h] [-o OUTFILE] [-s INDENT_WIDTH] [-e ENCODING]
-                        [-t {{html,js,css}}] [-v]
-                        infile
-
-    Beautify HTML5, CSS, JavaScript - Version {1} (By {2})
+    usage: html5-print [-h] [-o OUTFILE] [-i] [-r] [-j JOBS] [-U URL_FILE]
+                       [--connections CONNECTIONS] [-s INDENT_WIDTH] [-e ENCODING]
+                       [-t {{html,js,css}}] [-p {{html5lib,lxml,html.parser,auto}}]
+                       [--css-engine {{tokens,structured}}]
+                       [--js-mode {{parse,reindent}}] [-c CACHE_DIR] [--profile]
+                       [--daemon] [--stdio] [--socket SOCKET] [--no-daemon]
+                       [--stop-daemon] [-v]
+                       [infile [infile ...]]
+
+    Beautify HTML5, CSS, Javascript - Version {1} (By {2})
     This tool reformat the input and return a beautified version,
     in unicode.
 
     positional arguments:
-      infile                filename | url | -, a dash, which represents stdin
+      infile                filename | glob | directory | url | -, a dash, which
+                            represents stdin
 
     optional arguments:
       -h, --help            show this help message and exit
       -o OUTFILE, --output OUTFILE
-                            filename for formatted HTML, stdout if omitted
+                            filename for formatted html, stdout if omitted. Output
+                            directory if more than one file is given
+      -i, --in-place        overwrite input files with formatted output
+      -r, --recursive       format html, css and js files in directories
+                            recursively
+      -j JOBS, --jobs JOBS  number of files formatted in parallel, default 1
+      -U URL_FILE, --url-file URL_FILE
+                            file with urls to format, one per line
+      --connections CONNECTIONS
+                            number of urls downloaded at the same time, default 8
       -s INDENT_WIDTH, --indent-width INDENT_WIDTH
                             number of space for indentation, default 2
       -e ENCODING, --encoding ENCODING
                             encoding of input, default UTF-8
       -t {{html,js,css}}, --filetype {{html,js,css}}
-                            type of file to parse, default "html"
+                            type of file to parse, guessed from file extension,
+                            default html
+      -p {{html5lib,lxml,html.parser,auto}}, --parser {{html5lib,lxml,html.parser,auto}}
+                            HTML parser, default html5lib. "auto" uses a faster
+                            parser for well-formed documents
+      --css-engine {{tokens,structured}}
+                            CSS formatting engine, default tokens. "structured"
+                            formats parsed rules and declarations, ending each
+                            with a semicolon
+      --js-mode {{parse,reindent}}
+                            JavaScript formatting mode, default parse. "reindent"
+                            only re-indents lines, keeping comments, and parses
+                            scripts it cannot re-indent
+      -c CACHE_DIR, --cache-dir CACHE_DIR
+                            directory to cache formatted css and javascript across
+                            runs
+      --profile             print time spent in each stage to stderr
+      --daemon              run as a server on a Unix socket, keeping parsers
+                            warm. Later runs forward to it
+      --stdio               run as a server reading JSON-RPC requests from stdin,
+                            one per line
+      --socket SOCKET       socket of the server, default html5-print-UID.sock in
+                            $XDG_RUNTIME_DIR or in directory html5-print-UID of
+                            the temporary directory
+      --no-daemon           do not forward to a running server
+      --stop-daemon         stop the server on the socket
       -v, --version         show program's version number and exit
 
 Example
@@ -158,6 +231,22 @@ Pretty print HTML:
     </html>
     $
 
+Keep a server running to format files in milliseconds, e.g. from an editor
+or a pre-commit hook.  Later runs forward to it until it is stopped:
+
+.. code-block:: sh
+
+    $ html5-print --daemon &
+    $ html5-print -o page.html page.html
+    $ html5-print --stop-daemon
+
+Format a list of pages, downloaded over reused connections, into a
+directory mirroring host and path of each url:
+
+.. code-block:: sh
+
+    $ html5-print -U urls.txt -o pages/
+
 Create valid HTML5 document from HTML fragment:
 
 .. code-block:: sh
@@ -234,4 +323,4 @@ Python API
 ----------
 """.format(__version__, __version__, __author__)
 __all__ = ['CSSBeautifier', 'JSBeautifier', 'HTMLBeautifier', 'decodeText',
-           'isUnicode']
+           'isUnicode', 'ResultCache', 'Stats']
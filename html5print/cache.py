@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Bernard Yue
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import unicode_literals, absolute_import
+
+import os
+import io
+import hashlib
+import threading
+import collections
+
+from .utils import isUnicode
+
+
+class ResultCache(object):
+    """Cache of beautified results keyed on a hash of the input, the indent,
+    the beautifier and the version of this module.  Results are kept in an
+    in-memory LRU and, if `directory` is given, in a directory on disk so
+    that they survive across runs.  The cache can be shared by threads.
+
+    :param maxsize:     number of results kept in memory
+    :param directory:   directory for the on-disk store, None to disable
+    :param maxDiskSize: size in bytes the on-disk store is trimmed to, least
+                        recently used results are removed first
+
+    >>> from html5print import CSSBeautifier, ResultCache
+    >>> cache = ResultCache(maxsize=16)
+    >>> css = 'p { color: red; }'
+    >>> print(CSSBeautifier.beautify(css, cache=cache))
+    p {
+      color               : red;
+    }
+    >>> print(CSSBeautifier.beautify(css, cache=cache))
+    p {
+      color               : red;
+    }
+    >>> cache.hits, cache.misses
+    (1, 1)
+    """
+
+    suffix = '.txt'
+
+    def __init__(self, maxsize=128, directory=None,
+                 maxDiskSize=64 * 1024 * 1024):
+        self.maxsize = maxsize
+        self.directory = directory
+        self.maxDiskSize = maxDiskSize
+        self.hits = 0
+        self.misses = 0
+        self._memory = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._diskSize = None
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    @staticmethod
+    def makeKey(beautifier, text, indent=2, encoding=None):
+        """Return the cache key of a beautify call
+
+        :param beautifier: name of the beautifier, e.g. 'CSSBeautifier'
+        :param text:       input text, unicode or bytes
+        :param indent:     width of indentation
+        :param encoding:   encoding of `text`
+        :returns:          key as a hex string
+        """
+        from . import __version__
+        if isUnicode(text):
+            text = text.encode('utf-8')
+        header = '{0}\0{1}\0{2}\0{3}\0'.format(__version__, beautifier,
+                                               indent, encoding or '')
+        digest = hashlib.sha256(header.encode('utf-8'))
+        digest.update(text)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + self.suffix)
+
+    def get(self, key):
+        """Return the result stored under `key`, None if not found"""
+        with self._lock:
+            result = self._memory.pop(key, None)
+            if result is not None:
+                self._memory[key] = result        # most recently used
+                self.hits += 1
+                return result
+        result = self._readDisk(key) if self.directory else None
+        with self._lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._remember(key, result)
+        return result
+
+    def set(self, key, result):
+        """Store `result` under `key`"""
+        with self._lock:
+            self._remember(key, result)
+        if self.directory:
+            self._writeDisk(key, result)
+
+    def clear(self):
+        """Remove all results, from memory and from disk, and reset the
+        counters"""
+        with self._lock:
+            self._memory.clear()
+            self.hits = self.misses = 0
+            if self.directory:
+                for path, size, mtime in self._diskEntries():
+                    os.remove(path)
+                self._diskSize = 0
+
+    @property
+    def stats(self):
+        """a dictionary of hits, misses and number of results in memory"""
+        return dict(hits=self.hits, misses=self.misses,
+                    size=len(self._memory))
+
+    def _remember(self, key, result):
+        self._memory.pop(key, None)
+        self._memory[key] = result
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    def _readDisk(self, key):
+        path = self._path(key)
+        try:
+            with io.open(path, 'r', encoding='utf-8', newline='') as fh:
+                result = fh.read()
+            os.utime(path, None)          # mark as recently used
+        except (IOError, OSError):
+            return None
+        return result
+
+    def _writeDisk(self, key, result):
+        path = self._path(key)
+        data = result.encode('utf-8')
+        tmp = '{0}.{1}.{2}.tmp'.format(path, os.getpid(),
+                                       threading.current_thread().ident)
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with io.open(tmp, 'wb') as fh:
+                fh.write(data)
+            try:
+                oldSize = os.path.getsize(path)
+            except OSError:
+                oldSize = 0
+            getattr(os, 'replace', os.rename)(tmp, path)
+        except (IOError, OSError):
+            # another process wrote the same result, or disk is full
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        with self._lock:
+            if self._diskSize is None:
+                self._diskSize = sum(e[1] for e in self._diskEntries())
+            else:
+                self._diskSize += len(data) - oldSize
+            if self._diskSize > self.maxDiskSize:
+                self._trimDisk()
+
+    def _diskEntries(self):
+        """list of (path, size, mtime) of results on disk"""
+        entries = []
+        for root, dirs, files in os.walk(self.directory):
+            for f in files:
+                if not f.endswith(self.suffix):
+                    continue
+                path = os.path.join(root, f)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, st.st_size, st.st_mtime))
+        return entries
+
+    def _trimDisk(self):
+        """remove least recently used results until the store is within
+        90% of `maxDiskSize`"""
+        entries = sorted(self._diskEntries(), key=lambda e: (e[2], e[0]))
+        total = sum(e[1] for e in entries)
+        limit = self.maxDiskSize * 0.9
+        for path, size, mtime in entries:
+            if total <= limit:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._diskSize = total
@@ -17,8 +17,9 @@
 from __future__ import unicode_literals, absolute_import
 
 import os
+import re
+import itertools
 import tinycss2
-import distutils.version
 
 from .utils import BeautifierBase, decodeText, isUnicode
 
@@ -27,48 +28,83 @@ class CSSBeautifier(BeautifierBase):
     """A CSS Beautifier that pretty print CSS.  It loosely supports CSS3.
     """
 
+    # formatting engines, `engine` is used when none is given
+    #   tokens:     regroups the tokens of tinycss2 into rules, keeping the
+    #               text of declarations as written
+    #   structured: walks the rules and declarations of
+    #               tinycss2.parse_stylesheet, ends every declaration with
+    #               ';'.  Rules tinycss2 cannot parse are formatted with
+    #               `tokens`
+    engines = ['tokens', 'structured']
+    engine = 'tokens'
+
+    # at-rules whose block holds declarations, when tinycss2 is too old to
+    # tell by itself
+    _declarationAtRules = frozenset(['font-face', 'page', 'counter-style',
+                                     'property', 'font-palette-values',
+                                     'viewport'])
+
     @staticmethod
-    def _tinycss2ParserFlag():
+    def _versionTuple(version):
+        """Return `version` as a tuple of integers, ignoring pre-release or
+        other suffixes
+
+        :param version:  version string, e.g. ``tinycss2.VERSION``
+        :returns:        a tuple of integers
+
+        >>> CSSBeautifier._versionTuple('1.0.0b1')
+        (1, 0, 0)
+        """
+        numbers = re.match(r'\d+(?:\.\d+)*', version).group()
+        return tuple(int(n) for n in numbers.split('.'))
+
+    @classmethod
+    def _tinycss2ParserFlag(cls, version=None):
         """return the keyword params required for including comments during CSS
-        parsing
+        parsing.  Resolved once as `PARSER_FLAGS` when the module is
+        imported.
 
+        :param version: version of tinycss2 as a tuple, `TINYCSS2_VERSION`
+                        if None
         :returns:    a dictionary objects with keywords for including comments
 
-        >>> import tinycss2
-        >>> original = tinycss2.VERSION
-
-        >>> tinycss2.VERSION = '0.4'
-        >>> CSSBeautifier._tinycss2ParserFlag()
+        >>> CSSBeautifier._tinycss2ParserFlag((0, 4))
         {'preserve_comments': True}
 
-        >>> tinycss2.VERSION = '0.5'
-        >>> CSSBeautifier._tinycss2ParserFlag()
+        >>> CSSBeautifier._tinycss2ParserFlag((0, 5))
         {'skip_comments': False}
-
-        >>> tinycss2.VERSION = original  # remove side effect of doctest...
         """
-        LooseVersion = distutils.version.LooseVersion
-        if LooseVersion(tinycss2.VERSION) >= LooseVersion('0.5'):
+        if (version or TINYCSS2_VERSION) >= (0, 5):
             return dict(skip_comments=False)
         else:
             return dict(preserve_comments=True)
 
-    @staticmethod
-    def _foundSelector(node):
+    # nodes starting a CSS Selector: tokens of these types, and literals
+    # with these values
+    _selectorTypes = frozenset((tinycss2.ast.HashToken,
+                                tinycss2.ast.IdentToken,
+                                tinycss2.ast.AtKeywordToken))
+    _selectorLiterals = frozenset(('.', '*', ':'))
+
+    @classmethod
+    def _foundSelector(cls, node):
         """Determine if `node` represents beginning of a CSS Selector
 
         :param node: an AST node
         :returns:    | **True** if node represents beginning of a CSS Selector,
                      | **False** otherwise
+
+        >>> import tinycss2
+        >>> from html5print import CSSBeautifier
+        >>> ast = tinycss2.parse_component_value_list('*:hover > p')
+        >>> [CSSBeautifier._foundSelector(node) for node in ast]
+        [True, True, True, False, False, False, True]
         """
-        ns = tinycss2.ast
-        found = False
-        stypes = [ns.HashToken, ns.IdentToken, ns.AtKeywordToken]
-        if sum(map(isinstance, [node] * len(stypes), stypes)):
-            found = True
-        elif isinstance(node, ns.LiteralToken) and node.serialize() in '.*:':
-            found = True
-        return found
+        nodeType = type(node)
+        if nodeType in cls._selectorTypes:
+            return True
+        return nodeType is tinycss2.ast.LiteralToken and \
+            node.value in cls._selectorLiterals
 
     @staticmethod
     def _serializeSelector(ast):
@@ -79,22 +115,16 @@ class CSSBeautifier(BeautifierBase):
         :returns:   serialized css selector
 
         >>> import tinycss2
-        >>> from distutils.version import LooseVersion
-        >>> from html5print import CSSBeautifier
+        >>> from html5print.cssprint import CSSBeautifier, PARSER_FLAGS
 
         >>> data = '.abc /* comment */ { margin:10px,20px; }'
-        >>> if LooseVersion(tinycss2.VERSION) >= LooseVersion('0.5'):
-        ...    extra = (False,)
-        ... else:
-        ...    extra = (True,)
-
-        >>> ast = tinycss2.parse_component_value_list(data, *extra)
+        >>> ast = tinycss2.parse_component_value_list(data, **PARSER_FLAGS)
         >>> print('"{0}"'.format(CSSBeautifier._serializeSelector(ast)))
         ".abc /* comment */ "
 
         >>> # multiple selectors
         >>> data = 'p, h1, h2 /* comment */ { margin:10px,20px; }'
-        >>> ast = tinycss2.parse_component_value_list(data, *extra)
+        >>> ast = tinycss2.parse_component_value_list(data, **PARSER_FLAGS)
         >>> print('"{0}"'.format(CSSBeautifier._serializeSelector(ast)))
         "p, h1, h2 /* comment */ "
         """
@@ -183,17 +213,11 @@ class CSSBeautifier(BeautifierBase):
         :returns:       seialized declaration
 
         >>> import tinycss2
-        >>> from distutils.version import LooseVersion
-        >>> from html5print import CSSBeautifier
-
-        >>> if LooseVersion(tinycss2.VERSION) >= LooseVersion('0.5'):
-        ...    extra = (False,)
-        ... else:
-        ...    extra = (True,)
+        >>> from html5print.cssprint import CSSBeautifier, PARSER_FLAGS
 
         >>> # css with comments and random space between elements
         >>> data = '.abc /* comment */ { margin:10px 20px; /* hello */ }'
-        >>> ast = tinycss2.parse_component_value_list(data, *extra)
+        >>> ast = tinycss2.parse_component_value_list(data, **PARSER_FLAGS)
         >>> print("'{0}'".format(CSSBeautifier._serializeDeclarations(ast[-1])))
         '  margin              : 10px 20px; /* hello */'
 
@@ -204,56 +228,55 @@ class CSSBeautifier(BeautifierBase):
 
         >>> # css with no spaces between elements
         >>> data = '.abc/*comment*/{margin:10px 20px;}'
-        >>> ast = tinycss2.parse_component_value_list(data, *extra)
+        >>> ast = tinycss2.parse_component_value_list(data, **PARSER_FLAGS)
         >>> print("'{0}'".format(CSSBeautifier._serializeDeclarations(ast[-1])))
         '  margin              : 10px 20px;'
 
         >>> # css with random spaces between elements
         >>> data = '.abc /* comment */ { margin:10px 20px; }'
-        >>> ast = tinycss2.parse_component_value_list(data, *extra)
+        >>> ast = tinycss2.parse_component_value_list(data, **PARSER_FLAGS)
         >>> print("'{0}'".format(CSSBeautifier._serializeDeclarations(ast[-1])))
         '  margin              : 10px 20px;'
 
         >>> # css with two declarations
         >>> data = '.abc /* comment */ { margin:10px 20px; '
         >>> data += os.linesep + ' color: red; }'
-        >>> ast = tinycss2.parse_component_value_list(data, *extra)
+        >>> ast = tinycss2.parse_component_value_list(data, **PARSER_FLAGS)
         >>> print("'{0}'".format(CSSBeautifier._serializeDeclarations(ast[-1])))
         '  margin              : 10px 20px;
           color               : red;'
 
         >>> data = 'a.red:visited { color: #FF0000; }'
-        >>> ast = tinycss2.parse_component_value_list(data, *extra)
+        >>> ast = tinycss2.parse_component_value_list(data, **PARSER_FLAGS)
         >>> print("'{0}'".format(CSSBeautifier._serializeDeclarations(ast[-1])))
         '  color               : #FF0000;'
 
         """
         contents = []
-        content = ''
+        parts = []
         entityEnded = False
         ns = tinycss2.ast
         cbb.content = cls._stripAST(cbb.content)
 
         for node in cbb.content:
-            if node.serialize() == ';':
+            if isinstance(node, ns.LiteralToken) and node.value == ';':
                 entityEnded = True
-            if entityEnded and isinstance(node, ns.IdentToken):
+            elif entityEnded and isinstance(node, ns.IdentToken):
                 # new declaration encountered
                 # write last entity and then reset
-                contents.append(content.rstrip())
+                contents.append(''.join(parts).rstrip())
                 entityEnded = False
-                content = node.serialize()
-            else:
-                content += node.serialize()
-        contents.append(content)
+                parts = []
+            parts.append(node.serialize())
+        contents.append(''.join(parts))
 
-        for c, i in zip(contents, range(len(contents))):
+        lines = []
+        for c in contents:
             if ':' in c and '::' not in c:
                 p, v = c.split(':', 1)
-                contents[i] = '{0:<20}: {1}'.format(p, v.lstrip())
-            else:
-                contents[i] = contents[i]
-        return os.linesep.join(' ' * indent + c for c in contents)
+                c = '{0:<20}: {1}'.format(p, v.lstrip())
+            lines.append(' ' * indent + c)
+        return os.linesep.join(lines)
 
     @classmethod
     def _serializeCSSRule(cls, ast, indent=2):
@@ -264,16 +287,10 @@ class CSSBeautifier(BeautifierBase):
         :returns:       seialized CSS rule
 
         >>> import tinycss2
-        >>> from distutils.version import LooseVersion
-        >>> from html5print import CSSBeautifier
-
-        >>> if LooseVersion(tinycss2.VERSION) >= LooseVersion('0.5'):
-        ...    extra = (False,)
-        ... else:
-        ...    extra = (True,)
+        >>> from html5print.cssprint import CSSBeautifier, PARSER_FLAGS
 
         >>> data = '.abc /* comment */ { margin:10px 20px; /* hello */ }'
-        >>> ast = tinycss2.parse_component_value_list(data, *extra)
+        >>> ast = tinycss2.parse_component_value_list(data, **PARSER_FLAGS)
         >>> print(CSSBeautifier._serializeCSSRule(ast))
         .abc /* comment */ {
           margin              : 10px 20px; /* hello */
@@ -281,32 +298,64 @@ class CSSBeautifier(BeautifierBase):
 
         >>> # CSS rule with ':'
         >>> data = 'a.red:visited { color: #FF0000; }'
-        >>> ast = tinycss2.parse_component_value_list(data, *extra)
+        >>> ast = tinycss2.parse_component_value_list(data, **PARSER_FLAGS)
         >>> print(CSSBeautifier._serializeCSSRule(ast))
         a.red:visited {
           color               : #FF0000;
         }
+
+        >>> # nested at-rules
+        >>> data = '@supports (display: grid) { @media print { p { a: b } } }'
+        >>> ast = tinycss2.parse_component_value_list(data, **PARSER_FLAGS)
+        >>> print(CSSBeautifier._serializeCSSRule(ast))
+        @supports (display: grid) {
+          @media print {
+            p {
+              a                   : b
+            }
+          }
+        }
         """
-        selector = cls._serializeSelector(ast)
-        if selector[0] == '@':
-            # media query has nested css rule, need special handling
-            thisAst = ast[-1].content
-            parsed = []
-            for a, isCSSRule in cls._getCSSObjects(thisAst):
-                if isCSSRule:
-                    text = cls._serializeCSSRule(a, indent)
-                else:
-                    text = cls._serializeComments(a)
-                if text:
-                    parsed.extend(text.split(os.linesep))
-            parsed = (' ' * indent + p for p in parsed)
-            declarations = os.linesep.join(parsed)
-        else:
-            declarations = cls._serializeDeclarations(ast[-1], indent)
-        return os.linesep.join((selector + '{', declarations, '}'))
+        sep = os.linesep
+        pieces = []
+        # one entry per open block: [CSS objects in it, number written]
+        stack = [[iter([(ast, True)]), 0]]
+        while stack:
+            depth = len(stack) - 1
+            pad = ' ' * indent * depth
+            entry = stack[-1]
+            cssObj = next(entry[0], None)
+            if cssObj is None:
+                stack.pop()
+                if stack:
+                    # close the at-rule of this block, one level up
+                    pad = pad[indent:]
+                    if not entry[1]:
+                        pieces.append(pad)
+                    pieces.append(pad + '}')
+                continue
+            ast, isCSSRule = cssObj
+            if isCSSRule:
+                selector = cls._serializeSelector(ast)
+                if selector[0] == '@':
+                    # media query has nested css rule, its lines are
+                    # written as they come at their final indent
+                    pieces.append(pad + selector + '{')
+                    entry[1] += 1
+                    stack.append([cls._getCSSObjects(ast[-1].content), 0])
+                    continue
+                text = sep.join((selector + '{',
+                                 cls._serializeDeclarations(ast[-1], indent),
+                                 '}'))
+            else:
+                text = cls._serializeComments(ast)
+            if text:
+                pieces.append(pad + text.replace(sep, sep + pad))
+                entry[1] += 1
+        return sep.join(pieces)
 
     @classmethod
-    def beautify(cls, css, indent=2, encoding=None):
+    def beautify(cls, css, indent=2, encoding=None, cache=None, engine=None):
         """Prettifing `css` by reindending to width of `indent` per
         level.  `css` is expected to be a valid Cascading Style Sheet
 
@@ -314,6 +363,9 @@ class CSSBeautifier(BeautifierBase):
         :param indent:   width od indentation per level
         :param encoding: expected encoding of `css`.  If None, it will be
                          guesssed
+        :param cache:    a `ResultCache` object to look up and store the
+                         result, None for no caching
+        :param engine:   one of `engines`, `engine` if None
         :returns:        reindented css
 
         >>> # a single css rule
@@ -387,18 +439,331 @@ class CSSBeautifier(BeautifierBase):
             }
         }
         """
-        text = decodeText(css)
-        extra = cls._tinycss2ParserFlag()
-        ast = tinycss2.parse_component_value_list(text, **extra)
-        parsed = []
+        engine = cls._checkEngine(engine)
+        if cache is not None:
+            variant = None if engine == 'tokens' else engine
+            return cls._cached(cache, css, indent, encoding,
+                               lambda: cls.beautify(css, indent, encoding,
+                                                    engine=engine),
+                               variant)
+        return ''.join(cls.beautifyIter(css, indent, encoding, engine))
+
+    @classmethod
+    def _checkEngine(cls, engine):
+        """Return `engine`, or the default `engine` if None.  Raise
+        ValueError if it is unknown"""
+        engine = engine or cls.engine
+        if engine not in cls.engines:
+            raise ValueError('Unknown engine {0!r}, expected one of '
+                             '{1}'.format(engine, ', '.join(cls.engines)))
+        if engine == 'structured' and STYLESHEET_FLAGS is None:
+            raise ValueError('engine structured requires '
+                             'tinycss2.parse_stylesheet')
+        return engine
+
+    # brackets, and start of strings, comments, urls and escapes within
+    # which brackets do not open or close a block
+    _reBlockToken = re.compile(r'[{}()\[\]"\'\\]|/\*|'
+                               r'(?<![-\w\x80-\uffff])url\(', re.I | re.U)
+    _reEscape = re.compile(r'\\(?:[0-9a-fA-F]{1,6}(?:\r\n|[ \t\n\r\f])?|'
+                           r'[^\n\r\f])?')
+    _reStringEnd = {'"': re.compile(r'["\\\n\r\f]'),
+                    "'": re.compile(r"['\\\n\r\f]")}
+    _reURLEnd = re.compile(r'[)\\ \t\n\r\f"\'(\x00-\x08\x0b\x0e-\x1f\x7f]',
+                           re.U)
+    _reURLWhitespace = re.compile(r'[ \t\n\r\f]*')
+    _reBadURLEnd = re.compile(r'(?<!\\)\)')
+    _reURLStart = re.compile(r'url\([ \t\n\r\f]*', re.I)
+    _closingBrackets = {'{': '}', '(': ')', '[': ']'}
+
+    @classmethod
+    def _iterTopLevel(cls, chunks):
+        """Join `chunks` and split them after every ``}`` closing a top
+        level block, so that each piece is tokenized the same on its own
+        as within the whole css.  Brackets are matched as tinycss2 does;
+        the ones within strings, comments and unquoted urls, and escaped
+        ones, are skipped.
+
+        :param chunks: iterable of unicode
+        :returns:      a generator of css pieces, each ends with the ``}``
+                       of a top level block except maybe the last one
+
+        >>> from html5print import CSSBeautifier
+        >>> chunks = ['p { content: "}" } /* { */ a { b', ': c } @media ',
+        ...           'x { p { x: f(}) } } q']
+        >>> for piece in CSSBeautifier._iterTopLevel(chunks):
+        ...     print(repr(str(piece)))
+        'p { content: "}" }'
+        ' /* { */ a { b: c }'
+        ' @media x { p { x: f(}) } }'
+        ' q'
+        """
+        parts = []
+        buf = ''
+        start = pos = 0
+        stack = []
+        chunks = iter(chunks)
+        final = False
+        while not final:
+            chunk = next(chunks, None)
+            if chunk is None:
+                final = True
+            else:
+                # keep only unscanned text, the rest is joined once
+                parts.append(buf[start:pos])
+                buf = buf[pos:] + chunk
+                start = pos = 0
+            # tokens starting from `limit` may continue in the next chunk
+            limit = len(buf) if final else len(buf) - 3
+            while pos < limit:
+                m = cls._reBlockToken.search(buf, pos)
+                if m is None or m.start() >= limit:
+                    pos = limit
+                    break
+                token = m.group()
+                end = m.end()
+                if token in cls._closingBrackets:
+                    stack.append(cls._closingBrackets[token])
+                elif token in '})]':
+                    if stack and stack[-1] == token:
+                        stack.pop()
+                        if not stack and token == '}':
+                            yield ''.join(parts) + buf[start:end]
+                            parts = []
+                            start = end
+                elif token == '\\':
+                    end = cls._reEscape.match(buf, m.start()).end()
+                    if not final and end + 4 > len(buf):
+                        end = -1
+                    elif end > m.end() and \
+                            buf[end:end + 4].lower() == 'url(':
+                        stack.append(')')       # a function, e.g. \-url(
+                        end += 4
+                elif token == '/*':
+                    end = buf.find('*/', end)
+                    end = -1 if end < 0 else end + 2
+                elif token in '"\'':
+                    end = cls._skipEscaped(cls._reStringEnd[token], buf, end)
+                else:
+                    end = cls._reURLStart.match(buf, m.start()).end()
+                    if end == len(buf):
+                        end = -1
+                    elif buf[end] in '"\'':
+                        stack.append(')')       # a function, url("...")
+                    else:
+                        end = cls._skipURL(buf, end)
+                if end < 0 or end > len(buf):
+                    # rest of the token is in the next chunk
+                    if final:
+                        pos = len(buf)
+                    break
+                pos = end
+        rest = ''.join(parts) + buf[start:]
+        if rest:
+            yield rest
+
+    @classmethod
+    def _skipEscaped(cls, pattern, text, pos):
+        """Return the position after the first match of `pattern` in `text`
+        from `pos` that is not escaped by a backslash, -1 if not found"""
+        while True:
+            m = pattern.search(text, pos)
+            if m is None:
+                return -1
+            if m.group() != '\\':
+                return m.end()
+            if text.startswith('\r\n', m.end()):
+                pos = m.end() + 2
+            else:
+                pos = cls._reEscape.match(text, m.start()).end()
+                if pos == m.end() and pos < len(text):
+                    pos += 1                    # escaped newline
+            if pos >= len(text):
+                return -1
+
+    @classmethod
+    def _skipURL(cls, text, pos):
+        """Return the position after the unquoted url starting at `pos`,
+        i.e. after ``url(``, -1 if it does not end within `text`"""
+        while True:
+            m = cls._reURLEnd.search(text, pos)
+            if m is None:
+                return -1
+            c = m.group()
+            if c == ')':
+                return m.end()
+            if c == '\\':
+                pos = cls._reEscape.match(text, m.start()).end()
+                if pos >= len(text):
+                    return -1
+                continue                # an escape, or a backslash alone
+            if c in ' \t\n\r\f':
+                pos = cls._reURLWhitespace.match(text, m.end()).end()
+                if text.startswith(')', pos):
+                    return pos + 1
+            break
+        # remnants of a bad url
+        m = cls._reBadURLEnd.search(text, pos)
+        return -1 if m is None else m.end()
+
+    @classmethod
+    def beautifyIter(cls, css, indent=2, encoding=None, engine=None):
+        """Prettify `css` like `beautify`, yielding each rule or comment as
+        soon as it is formatted.  Input is tokenized one top level block at
+        a time, so `css` given in chunks is never held in memory as a whole.
+        ``''.join(beautifyIter(css))`` is the same as ``beautify(css)``.
+
+        :param css:      css as string, or an iterable of unicode chunks,
+                         e.g. from `utils.iterDecode`
+        :param indent:   width of indentation per level
+        :param encoding: expected encoding of `css` given as string.  If
+                         None, it will be guessed
+        :param engine:   one of `engines`, `engine` if None
+        :returns:        a generator of formatted rules and comments, all
+                         but the first one start with os.linesep
+
+        >>> from html5print import CSSBeautifier
+        >>> chunks = ['.para { margin: 10px', ' 20px; } /* end */']
+        >>> for text in CSSBeautifier.beautifyIter(chunks):
+        ...     print(text.strip())
+        .para {
+          margin              : 10px 20px;
+        }
+        /* end */
+        """
+        engine = cls._checkEngine(engine)
+        if isinstance(css, (bytes, type(''))):
+            css = [decodeText(css, encoding)]
+        pieces = cls._iterTopLevel(css)
+        if engine == 'structured':
+            texts = cls._iterStructured(pieces, indent)
+        else:
+            texts = cls._iterTokens(pieces, indent)
+        return cls._joinTexts(texts)
+
+    @classmethod
+    def _iterTokens(cls, pieces, indent=2):
+        """Yield formatted rules and comments of css `pieces` with the
+        `tokens` engine"""
+        ast = itertools.chain.from_iterable(
+            tinycss2.parse_component_value_list(piece, **PARSER_FLAGS)
+            for piece in pieces)
         for ast, isCSSRule in cls._getCSSObjects(ast):
             if isCSSRule:
-                text = cls._serializeCSSRule(ast, indent)
+                yield cls._serializeCSSRule(ast, indent)
             else:
-                text = cls._serializeComments(ast)
-            if text:
-                parsed.append(text)
-        return os.linesep.join(parsed)
+                yield cls._serializeComments(ast)
+
+    @classmethod
+    def _iterStructured(cls, pieces, indent=2):
+        """Yield formatted rules and comments of css `pieces` with the
+        `structured` engine.  A piece tinycss2 reports a parse error for
+        is formatted with the `tokens` engine instead, so no text is lost.
+
+        >>> from html5print import CSSBeautifier
+        >>> css = ('@import url(a.css); p { color: red !important; '
+        ...        'content: "a::b" } /* c */ @media print { a { b: c } }')
+        >>> print(CSSBeautifier.beautify(css, engine='structured'))
+        @import url(a.css);
+        p {
+          color               : red !important;
+          content             : "a::b";
+        }
+        /* c */
+        @media print {
+          a {
+            b                   : c;
+          }
+        }
+        """
+        for piece in pieces:
+            rules = tinycss2.parse_stylesheet(piece, **STYLESHEET_FLAGS)
+            lines = []
+            try:
+                cls._structuredLines(rules, indent, lines)
+            except ValueError:
+                for text in cls._iterTokens([piece], indent):
+                    yield text
+                continue
+            for line in lines:
+                yield line
+
+    @staticmethod
+    def _serializeNodes(nodes):
+        return ''.join(node.serialize() for node in nodes).strip()
+
+    @classmethod
+    def _structuredLines(cls, nodes, indent, lines):
+        """Append formatted `nodes` of tinycss2 to `lines`.  A top level
+        rule or comment is appended as one item.  Nested blocks are walked
+        with a stack, each line is written once at its final indent.
+
+        :param nodes:  list of rules, declarations and comments
+        :param indent: width of indent per level
+        :param lines:  list of lines to append to
+        :raises:       ValueError if `nodes` contains a parse error
+        """
+        # one entry per open block: [nodes in it, previous node]
+        stack = [[iter(nodes), None]]
+        start = 0
+        while stack:
+            level = len(stack) - 1
+            pad = ' ' * indent * level
+            entry = stack[-1]
+            node = next(entry[0], None)
+            if node is None:
+                stack.pop()
+                if stack:
+                    lines.append(pad[indent:] + '}')
+                    if len(stack) == 1:
+                        lines[start:] = [os.linesep.join(lines[start:])]
+                continue
+            previous, entry[1] = entry[1], node
+            if node.type == 'error':
+                raise ValueError(node.message)
+            elif node.type == 'comment':
+                text = node.serialize()
+                if previous is not None and previous.type == 'declaration' \
+                        and cls._lastLine(previous) == node.source_line:
+                    lines[-1] += ' ' + text     # comment of the declaration
+                else:
+                    lines.append(pad + text)
+            elif node.type == 'declaration':
+                value = cls._serializeNodes(node.value)
+                if node.important:
+                    value += ' !important'
+                lines.append('{0}{1:<20}: {2};'.format(pad, node.name, value))
+            elif node.type in ('qualified-rule', 'at-rule'):
+                head = cls._serializeNodes(node.prelude)
+                if node.type == 'at-rule':
+                    head = ('@' + node.at_keyword + ' ' + head).rstrip()
+                if node.content is None:
+                    lines.append(pad + head + ';')
+                    continue
+                if not level:
+                    start = len(lines)
+                lines.append(pad + head + ' {')
+                stack.append([iter(cls._parseBlock(node)), None])
+
+    @staticmethod
+    def _lastLine(declaration):
+        """Return the source line `declaration` ends on"""
+        for node in reversed(declaration.value):
+            if node.type != 'whitespace':
+                return node.source_line
+        return declaration.source_line
+
+    @classmethod
+    def _parseBlock(cls, rule):
+        """Return the declarations, rules and comments in the block of
+        `rule`"""
+        if PARSE_BLOCKS_CONTENTS is not None:
+            return PARSE_BLOCKS_CONTENTS(rule.content, **STYLESHEET_FLAGS)
+        if rule.type == 'qualified-rule' or \
+                rule.lower_at_keyword in cls._declarationAtRules:
+            return tinycss2.parse_declaration_list(rule.content,
+                                                   **STYLESHEET_FLAGS)
+        return tinycss2.parse_rule_list(rule.content, **STYLESHEET_FLAGS)
 
     @classmethod
     def beautifyTextInHTML(cls, html, indent=2, encoding=None):
@@ -457,3 +822,21 @@ class CSSBeautifier(BeautifierBase):
         """
         return cls._findAndReplace(html, cls.reIndentAndStyle,
                                    cls.beautify, (indent,), indent)
+
+
+# capabilities of the installed tinycss2, resolved once
+TINYCSS2_VERSION = CSSBeautifier._versionTuple(tinycss2.VERSION)
+
+# keyword arguments of `tinycss2.parse_component_value_list` keeping comments
+PARSER_FLAGS = CSSBeautifier._tinycss2ParserFlag()
+
+# keyword arguments of `tinycss2.parse_stylesheet` keeping comments and
+# dropping whitespace between rules, None if it is not available
+if hasattr(tinycss2, 'parse_stylesheet'):
+    STYLESHEET_FLAGS = dict(PARSER_FLAGS, skip_whitespace=True)
+else:
+    STYLESHEET_FLAGS = None
+
+# `tinycss2.parse_blocks_contents`, parsing declarations and nested rules
+# alike, None if it is not available
+PARSE_BLOCKS_CONTENTS = getattr(tinycss2, 'parse_blocks_contents', None)
@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Bernard Yue
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""A long running formatting server which keeps parsers warm, and its client.
+
+Messages are JSON-RPC 2.0 objects, one per line, exchanged over a Unix
+socket or stdin / stdout.  Methods:
+
+    - ``format``, params ``filetype`` (html, css or js), ``payload`` (text)
+      or ``data`` (base64 encoded bytes), and optionally ``indent``,
+      ``encoding``, ``parser`` and ``cache_dir``.  Returns the beautified
+      text.
+    - ``ping``, returns the version of the server
+    - ``shutdown``, stops the server
+"""
+from __future__ import unicode_literals, absolute_import
+
+import os
+import stat
+import json
+import base64
+import socket
+import tempfile
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+from .utils import decodeText
+
+# JSON-RPC error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+FORMAT_ERROR = -32000
+
+FILETYPES = ('html', 'css', 'js')
+
+
+class DaemonError(Exception):
+    """Error reported by the server
+
+    :param message: description of the error
+    :param code:    JSON-RPC error code
+    """
+
+    def __init__(self, message, code=FORMAT_ERROR):
+        Exception.__init__(self, message)
+        self.code = code
+
+
+def defaultSocketPath():
+    """Return the default path of the server socket, private to the user
+
+    :returns: path of the socket, None if Unix sockets are not supported
+    """
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    user = os.getuid() if hasattr(os, 'getuid') else os.getpid()
+    # the temporary directory is shared, use a directory of the user there
+    directory = os.environ.get('XDG_RUNTIME_DIR') or os.path.join(
+        tempfile.gettempdir(), 'html5-print-{0}'.format(user))
+    return os.path.join(directory, 'html5-print-{0}.sock'.format(user))
+
+
+def isPrivate(path):
+    """Return **True** if `path` belongs to the user and other users have
+    no access to it, so that a server listening there is not someone
+    else's
+
+    :param path: path of a socket or directory
+    :returns:    **False** if `path` does not exist
+    """
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    if not hasattr(os, 'getuid'):
+        return True
+    return st.st_uid == os.getuid() and not stat.S_IMODE(st.st_mode) & 0o077
+
+
+def formatPayload(filetype, text, indent=2, encoding=None, parser='html5lib',
+                  cache=None):
+    """Beautify `text` of type `filetype`
+
+    :param filetype: html, css or js
+    :param text:     text to beautify, unicode or bytes
+    :param indent:   width of indentation
+    :param encoding: encoding of `text`, guessed if None
+    :param parser:   tree builder used for html
+    :param cache:    a `ResultCache` object, None for no caching
+    :returns:        beautified text
+
+    >>> print(formatPayload('css', 'p{color:red}'))
+    p {
+      color               : red
+    }
+    """
+    from . import CSSBeautifier, JSBeautifier, HTMLBeautifier
+    text = decodeText(text, encoding)
+    if filetype == 'html':
+        return HTMLBeautifier.beautify(text, indent, encoding, 'html5',
+                                       parser, cache)
+    elif filetype == 'css':
+        return CSSBeautifier.beautify(text, indent, cache=cache)
+    elif filetype == 'js':
+        return JSBeautifier.beautify(text, indent, cache=cache)
+    raise ValueError('Unknown filetype {0!r}, expected one of '
+                     '{1}'.format(filetype, ', '.join(FILETYPES)))
+
+
+class Server(object):
+    """Formatting server.  Requests are handled one at a time in the
+    serving thread, so the per-thread Javascript parser is built once and
+    reused for every request.
+
+    :param cacheSize: number of results kept in the in-memory cache
+
+    >>> server = Server()
+    >>> response = server.handleLine(json.dumps(dict(
+    ...     jsonrpc='2.0', id=1, method='format',
+    ...     params=dict(filetype='js', payload='var a=1'))))
+    >>> print(json.loads(response)['result'])
+    var a = 1;
+    """
+
+    # seconds a client may keep a connection idle
+    timeout = 30
+
+    def __init__(self, cacheSize=256):
+        from .cache import ResultCache
+        self.cacheSize = cacheSize
+        self.caches = {None: ResultCache(maxsize=cacheSize)}
+        self.stopped = False
+
+    def warmUp(self):
+        """Load the parsers, so the first request is as fast as the others"""
+        html = ('<html><head><style>p { color: red; }</style></head><body>'
+                '<script>var a = 1;</script></body></html>')
+        formatPayload('html', html)
+
+    def getCache(self, directory=None):
+        """return the result cache stored in `directory`, in memory only if
+        None"""
+        if directory not in self.caches:
+            from .cache import ResultCache
+            self.caches[directory] = ResultCache(self.cacheSize, directory)
+        return self.caches[directory]
+
+    def format(self, filetype=None, payload=None, data=None, indent=2,
+               encoding=None, parser='html5lib', cache_dir=None):
+        """the ``format`` method, see module documentation"""
+        if filetype not in FILETYPES:
+            raise DaemonError('filetype must be one of '
+                              '{0}'.format(', '.join(FILETYPES)),
+                              INVALID_PARAMS)
+        if data is not None:
+            text = base64.b64decode(data.encode('ascii'))
+        elif payload is not None:
+            text = payload
+        else:
+            raise DaemonError('payload or data is required', INVALID_PARAMS)
+        return formatPayload(filetype, text, indent, encoding, parser,
+                             self.getCache(cache_dir))
+
+    def ping(self):
+        """the ``ping`` method, returns version of the server"""
+        from . import __version__
+        return __version__
+
+    def shutdown(self):
+        """the ``shutdown`` method, stops serving after this request"""
+        self.stopped = True
+        return True
+
+    def handle(self, request):
+        """Handle one decoded JSON-RPC request
+
+        :param request: the request, a dictionary
+        :returns:       the response, a dictionary, None for notifications
+        """
+        if not isinstance(request, dict) or 'method' not in request:
+            return self._error(None, INVALID_REQUEST, 'Invalid request')
+        reqId = request.get('id')
+        methods = dict(format=self.format, ping=self.ping,
+                       shutdown=self.shutdown)
+        method = methods.get(request['method'])
+        if method is None:
+            response = self._error(reqId, METHOD_NOT_FOUND,
+                                   'Method not found')
+        else:
+            params = request.get('params') or {}
+            try:
+                if isinstance(params, dict):
+                    params = dict((str(k), v) for k, v in params.items())
+                    result = method(**params)
+                else:
+                    result = method(*params)
+            except DaemonError as e:
+                response = self._error(reqId, e.code, str(e))
+            except TypeError as e:
+                response = self._error(reqId, INVALID_PARAMS, str(e))
+            except Exception as e:
+                response = self._error(reqId, FORMAT_ERROR, '{0}: {1}'.format(
+                                       type(e).__name__, e))
+            else:
+                response = dict(jsonrpc='2.0', id=reqId, result=result)
+        return response if 'id' in request else None
+
+    def handleLine(self, line):
+        """Handle one request line
+
+        :param line: JSON encoded request, unicode or utf-8 bytes
+        :returns:    JSON encoded response, None if nothing to send back
+        """
+        if not isinstance(line, type('')):
+            line = line.decode('utf-8')
+        try:
+            request = json.loads(line)
+        except ValueError:
+            response = self._error(None, PARSE_ERROR, 'Parse error')
+        else:
+            response = self.handle(request)
+        if response is None:
+            return None
+        return json.dumps(response)
+
+    def serveStream(self, infile, outfile):
+        """Serve requests read line by line from `infile` until end of file
+        or shutdown, writing responses to `outfile`
+
+        :param infile:  a binary file object
+        :param outfile: a binary file object
+        """
+        while not self.stopped:
+            line = infile.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            response = self.handleLine(line)
+            if response is not None:
+                outfile.write(response.encode('utf-8') + b'\n')
+                outfile.flush()
+
+    def serveSocket(self, path=None):
+        """Serve requests on Unix socket `path` until shutdown.  A socket
+        file left behind by a server which is no longer running is replaced.
+
+        :param path: path of the socket, `defaultSocketPath()` if None
+        """
+        path = path or defaultSocketPath()
+        if path is None:
+            raise DaemonError('Unix sockets are not supported')
+        directory = os.path.dirname(path)
+        if path == defaultSocketPath():
+            if not os.path.isdir(directory):
+                os.makedirs(directory, 0o700)
+            if not isPrivate(directory):
+                raise DaemonError('{0} is accessible to other users, remove '
+                                  'it or use --socket'.format(directory))
+        if os.path.lexists(path):
+            if hasattr(os, 'getuid') and \
+                    os.lstat(path).st_uid != os.getuid():
+                raise DaemonError('{0} belongs to another user, not '
+                                  'replaced'.format(path))
+            if Client(path).isRunning():
+                raise DaemonError('a server is already listening on '
+                                  '{0}'.format(path))
+            os.remove(path)
+        owner = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            timeout = self.timeout
+
+            def handle(self):
+                try:
+                    owner.serveStream(self.rfile, self.wfile)
+                except (socket.error, IOError):
+                    pass            # client gone or idle for too long
+
+        # no other user may connect, not even before the chmod
+        umask = os.umask(0o177)
+        try:
+            server = socketserver.UnixStreamServer(path, Handler)
+        finally:
+            os.umask(umask)
+        try:
+            os.chmod(path, 0o600)
+            server.timeout = 0.5
+            while not self.stopped:
+                server.handle_request()
+        finally:
+            server.server_close()
+            if os.path.exists(path):
+                os.remove(path)
+
+    @staticmethod
+    def _error(reqId, code, message):
+        return dict(jsonrpc='2.0', id=reqId,
+                    error=dict(code=code, message=message))
+
+
+class Client(object):
+    """Client of a server listening on a Unix socket
+
+    :param path:    path of the socket, `defaultSocketPath()` if None
+    :param timeout: seconds to wait for a response
+    """
+
+    def __init__(self, path=None, timeout=60):
+        self.path = path or defaultSocketPath()
+        self.timeout = timeout
+        self._lastId = 0
+
+    def call(self, method, params=None):
+        """Call `method` on the server
+
+        :param method: name of the method
+        :param params: dictionary of parameters
+        :returns:      result of the call
+        :raises:       `DaemonError` for error reported by the server,
+                       socket.error if the server cannot be reached
+        """
+        self._lastId += 1
+        request = dict(jsonrpc='2.0', id=self._lastId, method=method,
+                       params=params or {})
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+            sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+            fh = sock.makefile('rb')
+            try:
+                line = fh.readline()
+            finally:
+                fh.close()
+        finally:
+            sock.close()
+        if not line:
+            raise socket.error('connection closed by server')
+        response = json.loads(line.decode('utf-8'))
+        if 'error' in response:
+            error = response['error']
+            raise DaemonError(error['message'], error['code'])
+        return response['result']
+
+    def format(self, filetype, text, indent=2, encoding=None,
+               parser='html5lib', cacheDir=None):
+        """Beautify `text` on the server, see `formatPayload`"""
+        params = dict(filetype=filetype, indent=indent, encoding=encoding,
+                      parser=parser, cache_dir=cacheDir)
+        if isinstance(text, bytes) and not isinstance(text, type('')):
+            params['data'] = base64.b64encode(text).decode('ascii')
+        else:
+            params['payload'] = text
+        return self.call('format', params)
+
+    def isRunning(self):
+        """Return **True** if a server answers on the socket"""
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            self.call('ping')
+        except (socket.error, IOError, ValueError, DaemonError):
+            return False
+        return True
+
+    def shutdown(self):
+        """Stop the server"""
+        return self.call('shutdown')
@@ -17,25 +17,217 @@
 from __future__ import unicode_literals, absolute_import
 
 import os
-import re
+import functools
+try:
+    from html.parser import HTMLParser
+except ImportError:
+    from HTMLParser import HTMLParser
 
-import bs4
-
-from .utils import BeautifierBase
+from .utils import BeautifierBase, decodeText
 from .cssprint import CSSBeautifier
 from .jsprint import JSBeautifier
 
 
+class _WellFormedChecker(HTMLParser):
+    """Scan html and tell if it is a complete, well-formed document which
+    a lenient parser builds the same tree for as html5lib, i.e. no fragment
+    repair is required.  This is a heuristic, the document is considered
+    well-formed when:
+
+    - it has explicit ``<html>``, ``<head>`` and ``<body>`` tags, in this
+      order, and no content outside of head and body
+    - head holds only metadata elements, e.g. ``<title>`` or ``<link>``
+    - every non-void tag is closed, in the order it is opened
+    - no block element is nested in ``<p>``
+    - tables hold only table content, e.g. a ``<tr>`` within ``<tbody>``,
+      so that html5lib neither inserts nor foster-parents elements
+    - no element which an element of its kind closes implicitly, e.g.
+      ``<form>``, ``<button>``, ``<h1>`` to ``<h6>`` or ``<li>``, is
+      nested in another
+    - it has no ``<svg>`` or ``<math>``, whose attribute names html5lib
+      adjusts
+    """
+
+    voidTags = frozenset(['area', 'base', 'br', 'col', 'embed', 'hr', 'img',
+                          'input', 'keygen', 'link', 'meta', 'param',
+                          'source', 'track', 'wbr'])
+    blockTags = frozenset(['address', 'article', 'aside', 'blockquote', 'div',
+                           'dl', 'fieldset', 'footer', 'form', 'h1', 'h2',
+                           'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'main',
+                           'nav', 'ol', 'p', 'pre', 'section', 'table',
+                           'ul'])
+    requiredTags = frozenset(['html', 'head', 'body'])
+    foreignTags = frozenset(['svg', 'math'])
+    metadataTags = frozenset(['base', 'link', 'meta', 'script', 'style',
+                              'template', 'title'])
+
+    # tags closing an open tag of the same kind, within the nearest of the
+    # boundary tags of the kind if any
+    implicitKinds = {'h1': 'h', 'h2': 'h', 'h3': 'h', 'h4': 'h', 'h5': 'h',
+                     'h6': 'h', 'a': 'a', 'button': 'button', 'form': 'form',
+                     'nobr': 'nobr', 'li': 'li', 'dd': 'd', 'dt': 'd',
+                     'option': 'option'}
+    kindBoundaries = {'li': frozenset(['ul', 'ol']), 'd': frozenset(['dl']),
+                      'option': frozenset(['select', 'datalist'])}
+
+    # tags allowed as children of table elements, other children and text
+    # are moved or wrapped by html5lib
+    _scriptTags = ('script', 'style', 'template')
+    tableContent = {
+        'table': frozenset(('caption', 'colgroup', 'thead', 'tbody',
+                            'tfoot') + _scriptTags),
+        'thead': frozenset(('tr',) + _scriptTags),
+        'tbody': frozenset(('tr',) + _scriptTags),
+        'tfoot': frozenset(('tr',) + _scriptTags),
+        'tr': frozenset(('td', 'th') + _scriptTags),
+        'colgroup': frozenset(['col', 'template']),
+    }
+
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.stack = []
+        self.seen = set()
+        self.wellFormed = True
+
+    def _nestedKind(self, tag):
+        """return True if an open tag is of the kind of `tag`"""
+        kind = self.implicitKinds.get(tag)
+        if kind is None:
+            return False
+        boundaries = self.kindBoundaries.get(kind, ())
+        for name in reversed(self.stack):
+            if name in boundaries:
+                return False
+            if self.implicitKinds.get(name) == kind:
+                return True
+        return False
+
+    def _allowed(self, tag):
+        """return True if start tag `tag` is allowed by the open tags"""
+        parent = self.stack[-1] if self.stack else None
+        if parent is None:
+            return tag == 'html' and not self.seen
+        if parent == 'html':
+            if tag == 'head':
+                return 'head' not in self.seen
+            return tag == 'body' and 'head' in self.seen and \
+                'body' not in self.seen
+        if parent == 'head':
+            return tag in self.metadataTags
+        if tag in self.blockTags and 'p' in self.stack:
+            return False
+        if tag in self.foreignTags or self._nestedKind(tag):
+            return False
+        if parent in self.tableContent and \
+                tag not in self.tableContent[parent]:
+            return False
+        return True
+
+    def _start(self, tag):
+        """check start tag `tag` against the open tags"""
+        if not self._allowed(tag):
+            self.wellFormed = False
+        self.seen.add(tag)
+
+    def handle_starttag(self, tag, attrs):
+        self._start(tag)
+        if tag not in self.voidTags:
+            self.stack.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self._start(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self.voidTags:
+            return
+        if not self.stack or self.stack.pop() != tag:
+            self.wellFormed = False
+
+    def handle_data(self, data):
+        if not data.strip():
+            return
+        parent = self.stack[-1] if self.stack else None
+        if parent in (None, 'html', 'head') or parent in self.tableContent:
+            self.wellFormed = False
+
+    def handle_entityref(self, name):
+        # python 2 reports references apart from the text around them
+        self.handle_data('&')
+
+    def handle_charref(self, name):
+        self.handle_data('&')
+
+    @classmethod
+    def check(cls, html):
+        """Return **True** if unicode `html` is a well-formed document"""
+        checker = cls()
+        checker.feed(html)
+        checker.close()
+        return (checker.wellFormed and not checker.stack and
+                cls.requiredTags <= checker.seen)
+
+
 class HTMLBeautifier(BeautifierBase):
     """HTML Beautifier.  Powered by BeautifulSoup 4"""
 
-    reSpace = re.compile(r'^(\s*)')
-    reBeginTag = re.compile('\s*(<[a-zA-Z].*?>)')       # match begin tag
-    reEndTag = re.compile('\s*(</[a-zA-Z].*?>|<.*/>)')  # match end tag
-    ignoreTags = ['style', 'script']
+    preserveTags = ['pre', 'textarea']    # tags written as is
+    parsers = ['html5lib', 'lxml', 'html.parser', 'auto']
+
+    @staticmethod
+    def _fastParser():
+        """return the fastest tree builder installed, `lxml` or
+        `html.parser`"""
+        import bs4.builder
+        if bs4.builder.builder_registry.lookup('lxml') is not None:
+            return 'lxml'
+        return 'html.parser'
 
     @classmethod
-    def beautify(cls, html, indent=2, encoding=None, formatter="html5"):
+    def _makeSoup(cls, html, encoding=None, parser='html5lib', stats=None):
+        """Parse `html` into a BeautifulSoup tree with tree builder `parser`
+
+        :param html:     html as string
+        :param encoding: encoding of html
+        :param parser:   one of `parsers`.  `auto` uses the fastest parser
+                         installed if `html` is a well-formed document and
+                         html5lib otherwise
+        :param stats:    a `Stats` object recording decode and parse time,
+                         None for no recording
+        :returns:        a bs4.BeautifulSoup object
+
+        >>> from html5print import HTMLBeautifier
+        >>> html = '<html><head></head><body><p>x</p></body></html>'
+        >>> HTMLBeautifier._makeSoup(html, parser='auto').builder.NAME in (
+        ...     'lxml', 'html.parser')
+        True
+        >>> HTMLBeautifier._makeSoup('<p>x', parser='auto').builder.NAME
+        'html5lib'
+        """
+        import bs4                    # slow to import, load on first use
+        if parser not in cls.parsers:
+            raise ValueError('Unknown parser {0!r}, expected one of '
+                             '{1}'.format(parser, ', '.join(cls.parsers)))
+        if stats is not None:
+            timer = stats.timer
+            start = timer()
+        if parser == 'auto':
+            size = len(html)
+            html = decodeText(html, encoding)
+            if stats is not None:
+                stats.add('decode', timer() - start, size, len(html))
+                start = timer()
+            parser = 'html5lib'
+            if _WellFormedChecker.check(html):
+                parser = cls._fastParser()
+        soup = bs4.BeautifulSoup(html, parser)
+        if stats is not None:
+            stats.add('parse', timer() - start, len(html))
+        return soup
+
+    @classmethod
+    def beautify(cls, html, indent=2, encoding=None, formatter="html5",
+                 parser='html5lib', cache=None, stats=None, cssEngine=None,
+                 jsMode=None):
         """Pretty print html with indentation of `indent` per level
 
         :param html:      html as string
@@ -43,6 +235,18 @@ class HTMLBeautifier(BeautifierBase):
         :param encoding:  encoding of html
         :param formatter: formatter to use by bs4.  use `lxml` if you want
                           HTML4 output
+        :param parser:    tree builder used by bs4, one of `html5lib`,
+                          `lxml`, `html.parser` or `auto`.  html5lib is the
+                          slowest but repairs fragmented HTML5; `auto` uses
+                          a faster parser for well-formed documents
+        :param cache:     a `ResultCache` object used for embedded CSS and
+                          Javascript, None for no caching
+        :param stats:     a `Stats` object recording time and sizes of each
+                          stage, None for no recording
+        :param cssEngine: engine of `CSSBeautifier` for embedded CSS, its
+                          default engine if None
+        :param jsMode:    mode of `JSBeautifier` for embedded Javascript,
+                          its default mode if None
         :returns:         beautified html
 
         >>> # pretty print HTML
@@ -105,66 +309,163 @@ class HTMLBeautifier(BeautifierBase):
         </html>
         <BLANKLINE>
         """
-        soup = bs4.BeautifulSoup(html, 'html5lib')
-        html = soup.prettify(formatter=formatter)
-        html = cls._prettifyWithIndent(html, indent)
-        html = JSBeautifier.beautifyTextInHTML(html, indent, encoding)
-        html = CSSBeautifier.beautifyTextInHTML(html, indent, encoding)
-        return html
+        return ''.join(cls.beautifyIter(html, indent, encoding, formatter,
+                                        parser, cache, stats, cssEngine,
+                                        jsMode))
 
     @classmethod
-    def _prettifyWithIndent(cls, html, indent=2):
-        """Prettify bs4.prettify output with `indent`
-        Note: Assumed `html` is input from bs4.prettify, which has indent
-              width of 1.
-
-        :param html:    html as string
-        :param indent:  width of indentation
-        :returns:       beautified html with bs4.prettify() error fixed
+    def beautifyIter(cls, html, indent=2, encoding=None, formatter="html5",
+                     parser='html5lib', cache=None, stats=None,
+                     cssEngine=None, jsMode=None):
+        """Pretty print html with indentation of `indent` per level, yielding
+        the result line by line.  The parse tree is walked directly, so the
+        prettified document never exists as a whole; embedded CSS and
+        Javascript are formatted as their blocks come up.
+
+        :param html:      html as string
+        :param indent:    width of indentation
+        :param encoding:  encoding of html
+        :param formatter: formatter to use by bs4
+        :param parser:    tree builder used by bs4, see `beautify`
+        :param cache:     a `ResultCache` object, see `beautify`
+        :param stats:     a `Stats` object, see `beautify`
+        :param cssEngine: engine of embedded CSS, see `beautify`
+        :param jsMode:    mode of embedded Javascript, see `beautify`
+        :returns:         a generator of beautified lines, each ends with
+                          os.linesep
+
+        >>> from html5print import HTMLBeautifier
+        >>> html = '<title>Testing</title><p>Some Text<br>More</p>'
+        >>> for line in HTMLBeautifier.beautifyIter(html, 4):
+        ...     print(line.rstrip())
+        <html>
+            <head>
+                <title>
+                    Testing
+                </title>
+            </head>
+            <body>
+                <p>
+                    Some Text
+                    <br>
+                    More
+                </p>
+            </body>
+        </html>
+        """
+        soup = cls._makeSoup(html, encoding, parser, stats)
+        lines = cls._iterLines(soup, indent, formatter, cache, stats,
+                               cssEngine, jsMode)
+        if stats is None:
+            return lines
+        return stats.timeIter('serialize', lines, exclude=('js', 'css'))
+
+    @classmethod
+    def _iterLines(cls, soup, indent=2, formatter="html5", cache=None,
+                   stats=None, cssEngine=None, jsMode=None):
+        """Walk the tree of `soup` and yield lines indented with `indent`
+        spaces per level.  Layout follows bs4 ``prettify()``: one tag or text
+        per line, except for tags whose whitespace must be preserved (e.g.
+        ``<pre>``), which are written as is.  Attribute values spanning
+        several lines are kept verbatim.
+
+        :param soup:      a bs4.BeautifulSoup object
+        :param indent:    width of indentation
+        :param formatter: formatter to use by bs4
+        :param cache:     a `ResultCache` object for embedded CSS and
+                          Javascript
+        :param stats:     a `Stats` object recording embedded CSS and
+                          Javascript as stages `css` and `js`
+        :param cssEngine: engine of `CSSBeautifier` for embedded CSS
+        :param jsMode:    mode of `JSBeautifier` for embedded Javascript
+        :returns:         a generator of lines, each ends with os.linesep
         """
-        final = []
-        lastNonBlankLine = ''
-        canChange = True
-        multiLineTag2ndLine = False
-        for line in html.splitlines():
-            if not line or not line.strip():
-                final.append(line)
+        import bs4
+        import bs4.formatter
+        if not isinstance(formatter, bs4.formatter.Formatter):
+            formatter = soup.formatter_for_name(formatter)
+        preserved = soup.preserve_whitespace_tags or cls.preserveTags
+        bfuncs = dict(script=functools.partial(JSBeautifier.beautify,
+                                               mode=jsMode),
+                      style=functools.partial(CSSBeautifier.beautify,
+                                              engine=cssEngine))
+        if stats is not None:
+            bfuncs = dict(script=stats.wrap('js', bfuncs['script']),
+                          style=stats.wrap('css', bfuncs['style']))
+        nl = os.linesep
+        stack = [iter(soup.contents)]
+        owners = [None]
+        while stack:
+            node = next(stack[-1], None)
+            if node is None:
+                stack.pop()
+                tag = owners.pop()
+                if tag is not None:
+                    spaces = ' ' * (len(stack) - 1) * indent
+                    yield spaces + cls._formatTag(tag, formatter, False) + nl
                 continue
-            spaces = cls.reSpace.match(line).group()
-            if line[len(spaces)] == '<':
-                stMatch = cls.reBeginTag.match(line)
-                etMatch = cls.reEndTag.match(line)
-                if stMatch and etMatch:
-                    pass
-                elif not stMatch and not etMatch:
-                    # multiline tag
-                    canChange = False
-                    multiLineTag2ndLine = True
-                elif etMatch:
-                    for tag in cls.ignoreTags:
-                        if '</' + tag in line.lower():
-                            canChange = True
-                            break
-                elif stMatch:
-                    for tag in cls.ignoreTags:
-                        if '<' + tag in line.lower():
-                            canChange = False
-                            break
-                line = ' ' * len(spaces) * indent + line.lstrip()
+            spaces = ' ' * (len(stack) - 1) * indent
+            if isinstance(node, bs4.Tag):
+                if node.is_empty_element:
+                    yield spaces + cls._formatTag(node, formatter) + nl
+                elif node.name in preserved:
+                    yield spaces + node.decode(formatter=formatter) + nl
+                elif node.name in bfuncs:
+                    yield spaces + cls._formatTag(node, formatter) + nl
+                    script = ''.join(c for c in node.contents
+                                     if isinstance(c, bs4.NavigableString))
+                    if script.strip():
+                        yield cls._formatSection(spaces, script,
+                                                 bfuncs[node.name],
+                                                 (indent, None, cache),
+                                                 indent) + nl
+                    yield spaces + cls._formatTag(node, formatter, False) + nl
+                else:
+                    yield spaces + cls._formatTag(node, formatter) + nl
+                    stack.append(iter(node.contents))
+                    owners.append(node)
             else:
-                if canChange:
-                    thisLevel = len(spaces) * indent
-                    if lastNonBlankLine.lstrip()[0] != '<':
-                        lastLevel = len(cls.reSpace.match(
-                                        lastNonBlankLine).group())
-                        if thisLevel > lastLevel + 4:
-                            line = ' ' * lastLevel + line.lstrip()
-                    else:
-                        line = ' ' * thisLevel + line.lstrip()
-                elif multiLineTag2ndLine:
-                    # now you are free
-                    canChange = True
-                    multiLineTag2ndLine = False
-            final.append(line)
-            lastNonBlankLine = line
-        return os.linesep.join(final) + os.linesep
+                text = node.output_ready(formatter).strip()
+                if not text:
+                    continue
+                if isinstance(node, bs4.element.PreformattedString):
+                    # comments, doctype etc. are written as is
+                    yield spaces + text + nl
+                else:
+                    for line in text.splitlines():
+                        line = line.strip()
+                        if line:
+                            yield spaces + line + nl
+
+    @staticmethod
+    def _formatTag(tag, formatter, opening=True):
+        """Return the opening (or closing) tag of `tag` as string
+
+        :param tag:       a bs4.Tag object
+        :param formatter: a bs4.formatter.Formatter object
+        :param opening:   **True** for opening tag, **False** for closing tag
+        :returns:         formatted tag
+        """
+        name = tag.prefix + ':' + tag.name if tag.prefix else tag.name
+        if not opening:
+            return '</' + name + '>'
+        pieces = ['<', name]
+        for key, val in formatter.attributes(tag):
+            if val is None:
+                pieces.append(' ' + key)
+                continue
+            if isinstance(val, (list, tuple)):
+                val = ' '.join(val)
+            elif hasattr(val, 'substitute_encoding'):
+                # output of beautifier is always unicode / utf-8
+                val = val.substitute_encoding('utf-8')
+            val = formatter.quoted_attribute_value(
+                formatter.attribute_value(val))
+            pieces.append(' ' + key + '=' + val)
+        if tag.is_empty_element:
+            # bs4 before 4.10 has no void_element_close_prefix, and always
+            # closes empty elements with "/"
+            prefix = getattr(formatter, 'void_element_close_prefix', '/')
+            pieces.append(prefix or '')
+        pieces.append('>')
+        return ''.join(pieces)
@@ -19,7 +19,7 @@ from __future__ import unicode_literals, absolute_import
 import os
 import sys
 import re
-import slimit
+import threading
 
 from .utils import BeautifierBase, decodeText
 
@@ -27,6 +27,53 @@ from .utils import BeautifierBase, decodeText
 class JSBeautifier(BeautifierBase):
     """A Javascript Beautifier that pretty print Javascript"""
 
+    # formatting modes, `mode` is used when none is given.  "parse"
+    # regenerates the script from the slimit AST, "reindent" only changes
+    # the indentation of each line, see `_reindentTokens`
+    modes = ['parse', 'reindent']
+    mode = 'parse'
+
+    # one slimit parser per thread, see `_getParser`
+    _parsers = threading.local()
+
+    @classmethod
+    def _getParser(cls):
+        """Return a slimit parser for the calling thread.  Building a parser
+        constructs the lexer and loads the PLY LALR tables, which costs far
+        more than parsing a typical embedded script, so the parser is built
+        once per thread and reused for every later call.
+
+        :returns:   a `slimit.parser.Parser` object
+
+        >>> from html5print import JSBeautifier
+        >>> JSBeautifier._getParser() is JSBeautifier._getParser()
+        True
+        """
+        parser = getattr(cls._parsers, 'parser', None)
+        if parser is None:
+            from slimit.parser import Parser
+            parser = Parser()
+            cls._parsers.parser = parser
+        return parser
+
+    @classmethod
+    def _parse(cls, js):
+        """Parse `js` with the parser of the calling thread.  State left
+        behind by the previous parse (auto semicolon lookahead, line number
+        and tokens recorded on syntax error) is cleared first.
+
+        :param js:  javascript as unicode
+        :returns:   root node of the AST
+        """
+        parser = cls._getParser()
+        lexer = parser.lexer
+        lexer.prev_token = None
+        lexer.cur_token = None
+        lexer.next_tokens = []
+        lexer.lexer.lineno = 1
+        parser._error_tokens = {}
+        return parser.parse(js)
+
     @classmethod
     def _reindenting(cls, js, indent=2, srcIndent=2):
         """indenting `js` using `indent` as width of indent per level.  This
@@ -60,8 +107,426 @@ class JSBeautifier(BeautifierBase):
             result.append(' ' * finalIndent + text)
         return '\n'.join(result)
 
+    # tokens of `_scanLines`.  Strings, template literals, block comments
+    # and regular expression literals are scanned by the patterns below
+    _reToken = re.compile(r'''
+        (?P<space>[^\S\r\n]+)
+      | (?P<newline>\r\n|\r|\n)
+      | (?P<comment>//[^\r\n]*|/\*)
+      | (?P<quote>["'`])
+      | (?P<name>[\w$\\]+)
+      | (?P<punct>>>>=?|\.\.\.|[=!]==|\*\*=|<<=|>>=|=>|\?\?=?|&&=?|\|\|=?
+                 |\?\.(?!\d)|[-+*/%&|^<>!=]=|\+\+|--|<<|>>|\*\*|[\s\S])
+    ''', re.X | re.U)
+    _reNewline = re.compile(r'\r\n|\r|\n')
+    _reString = {'"': re.compile(r'"(?:[^"\\\r\n]|\\(?:\r\n|[\s\S]))*"'),
+                 "'": re.compile(r"'(?:[^'\\\r\n]|\\(?:\r\n|[\s\S]))*'")}
+    _reTemplate = re.compile(r'(?:[^`\\$]|\\[\s\S]|\$(?!\{))*(?:`|\$\{)')
+    _reRegExp = re.compile(r'/(?:[^\\/\[\r\n]|\\[^\r\n]|'
+                           r'\[(?:[^\\\]\r\n]|\\[^\r\n])*\])+/[\w$]*', re.U)
+
+    # names after which "/" starts a regular expression, not a division
+    _regExpKeywords = frozenset(['return', 'typeof', 'instanceof', 'in', 'of',
+                                 'new', 'delete', 'void', 'throw', 'case',
+                                 'do', 'else', 'yield', 'await'])
+    _openers = {')': ('(',), ']': ('[',), '}': ('{', '${')}
+
+    # a line in a statement continues the previous line if it starts with
+    # one of `_continuingStarts`, or if the previous line ends with an
+    # operator, i.e. a punctuator not in `_statementEnds`
+    _continuingStarts = frozenset(['.', '?.', '?', ':', '&&', '||', '??'])
+    _statementEnds = frozenset([';', ',', ':', '(', '[', '{', '${', ')', ']',
+                                '}', '++', '--'])
+
+    # a line not starting with "{" is the body of the statement of the
+    # previous line if that line ends with the condition of one of
+    # `_controlNames`, or with one of `_bodyNames`
+    _controlNames = frozenset([('name', 'if'), ('name', 'for'),
+                               ('name', 'while'), ('name', 'with')])
+    _bodyNames = frozenset([('name', 'else'), ('name', 'do')])
+
+    @classmethod
+    def _regExpAllowed(cls, last):
+        """Determine if a "/" after token `last` starts a regular expression
+
+        :param last:  (kind, text) of the previous token, None at the start
+        :returns:     **True** for a regular expression, **False** for a
+                      division
+
+        >>> from html5print import JSBeautifier
+        >>> JSBeautifier._regExpAllowed(('punct', '('))
+        True
+        >>> JSBeautifier._regExpAllowed(('name', 'a'))
+        False
+        """
+        if last is None:
+            return True
+        kind, text = last
+        if kind == 'punct':
+            return text not in (')', ']', '}')
+        return kind == 'name' and text in cls._regExpKeywords
+
+    @classmethod
+    def _scanLines(cls, js):
+        """Scan `js` and describe the state at the start of each of its lines.
+        Only brackets, strings, comments, template literals and regular
+        expression literals are recognised, no syntax tree is built.
+
+        Each line is described by a dictionary of:
+          - mode:    "code", or "comment", "string" or "template" if the line
+                     starts inside one
+          - inner:   innermost open bracket, None if there is none
+          - parent:  index of the line opening `inner`, None if there is none
+          - closers: number of brackets closed before the first other token
+          - closed:  index of the line opening the last of those brackets
+          - first:   first token after those brackets, None if there is none
+          - last:    (kind, text) of the last token before the line,
+                     ignoring comments.  Kind is "control" for the ")"
+                     closing the condition of `_controlNames`
+          - comment: for "comment", index of the line the comment starts on
+
+        :param js:  javascript as unicode
+        :returns:   list of dictionaries, one per line
+        :raises ValueError: if brackets are unbalanced, or a string, comment
+                            or template literal is not terminated
+
+        >>> from html5print import JSBeautifier
+        >>> lines = JSBeautifier._scanLines('if (a) {\\n} /* b\\n*/')
+        >>> [(l['mode'], l['parent'], l['closed']) for l in lines]
+        [('code', None, None), ('code', 0, 0), ('comment', None, None)]
+        """
+        lines = []
+        stack = []
+        last = [None]
+
+        def newLine(mode, comment=None):
+            inner, parent = stack[-1][:2] if stack else (None, None)
+            lines.append(dict(mode=mode, inner=inner, parent=parent,
+                              closers=0, closed=None, first=None,
+                              last=last[0], comment=comment))
+
+        def template(pos):
+            mo = cls._reTemplate.match(js, pos)
+            if mo is None:
+                raise ValueError('Unterminated template literal')
+            for nl in cls._reNewline.finditer(js, pos, mo.end()):
+                newLine('template')
+            if mo.group().endswith('${'):
+                stack.append(('${', len(lines) - 1, False))
+                last[0] = ('punct', '${')
+            else:
+                last[0] = ('value', '`')
+            return mo.end()
+
+        newLine('code')
+        pos, end = 0, len(js)
+        while pos < end:
+            mo = cls._reToken.match(js, pos)
+            kind, text, pos = mo.lastgroup, mo.group(), mo.end()
+            if kind == 'space':
+                continue
+            if kind == 'newline':
+                newLine('code')
+                continue
+            line = lines[-1]
+            if line['first'] is None:
+                if kind == 'punct' and text in cls._openers:
+                    line['closers'] += 1
+                    line['closed'] = stack[-1][1] if stack else None
+                else:
+                    line['first'] = text
+            if kind == 'comment':
+                if text == '/*':
+                    close = js.find('*/', pos)
+                    if close < 0:
+                        raise ValueError('Unterminated comment')
+                    start = len(lines) - 1
+                    for nl in cls._reNewline.finditer(js, pos, close):
+                        newLine('comment', start)
+                    pos = close + 2
+            elif kind == 'quote':
+                if text == '`':
+                    pos = template(pos)
+                    continue
+                mo = cls._reString[text].match(js, pos - 1)
+                if mo is None:
+                    raise ValueError('Unterminated string')
+                for nl in cls._reNewline.finditer(js, pos, mo.end()):
+                    newLine('string')
+                pos = mo.end()
+                last[0] = ('value', text)
+            elif kind == 'name':
+                last[0] = ('name', text)
+            else:
+                if text[0] == '/' and cls._regExpAllowed(last[0]):
+                    mo = cls._reRegExp.match(js, pos - len(text))
+                    if mo is not None:
+                        pos = mo.end()
+                        last[0] = ('value', '/')
+                        continue
+                if text in ('(', '[', '{'):
+                    control = text == '(' and last[0] in cls._controlNames
+                    stack.append((text, len(lines) - 1, control))
+                    last[0] = ('punct', text)
+                elif text in cls._openers:
+                    if not stack or stack[-1][0] not in cls._openers[text]:
+                        raise ValueError('Unbalanced {0!r}'.format(text))
+                    opener, start, control = stack.pop()
+                    last[0] = ('control' if control else 'punct', text)
+                    if opener == '${':
+                        pos = template(pos)
+                else:
+                    last[0] = ('punct', text)
+        if stack:
+            raise ValueError('Unclosed {0!r}'.format(stack[-1][0]))
+        return lines
+
+    @classmethod
+    def _isContinued(cls, line):
+        """Determine if the line described by `line` continues the statement
+        of the previous line and takes an extra level of indentation.  Lines
+        within parentheses or square brackets are indented by those only.
+
+        :param line:  a line description from `_scanLines`
+        :returns:     **True** if the line is a continuation
+        """
+        if line['closers'] or line['inner'] not in (None, '{', '${'):
+            return False
+        if line['first'] in cls._continuingStarts:
+            return True
+        last = line['last']
+        if last is None:
+            return False
+        if last[0] == 'control' or last in cls._bodyNames:
+            return line['first'] != '{'
+        return last[0] == 'punct' and last[1] not in cls._statementEnds
+
+    # names continuing the statement before them, e.g. "else" after
+    # "if (a) b();", at which `_iterStatements` does not split
+    _joiningNames = frozenset(['else', 'catch', 'finally', 'while', 'in',
+                               'instanceof'])
+
+    @classmethod
+    def _iterStatements(cls, chunks, lines=False):
+        """Join `chunks` and split them after every ``;`` or ``}`` ending a
+        top level statement, so that each piece can be formatted on its own.
+        A ``;`` ends a statement unless one of `_joiningNames` follows, a
+        ``}`` only if another name follows.  Brackets, strings, comments,
+        template literals and regular expression literals are scanned as in
+        `_scanLines`.  Input is kept in memory one statement at a time.
+
+        :param chunks:  iterable of unicode
+        :param lines:   split only at the end of the line of the statement,
+                        so that each piece is made of whole lines
+        :returns:       a generator of javascript pieces
+
+        >>> from html5print import JSBeautifier
+        >>> chunks = ['if (a) b(); else c(); function f() { retu',
+        ...           'rn "};" } x = {}', '\\n(y)']
+        >>> for piece in JSBeautifier._iterStatements(chunks):
+        ...     print(repr(str(piece)))
+        'if (a) b(); else c();'
+        ' function f() { return "};" }'
+        ' x = {}\\n(y)'
+        """
+        parts = []
+        buf = ''
+        start = pos = 0
+        stack = []
+        last = None
+        template = False        # `pos` is within a template literal
+        boundary = split = ender = None
+        chunks = iter(chunks)
+        final = False
+        while not final:
+            chunk = next(chunks, None)
+            if chunk is None:
+                final = True
+            else:
+                # keep unscanned text, and text after a pending boundary
+                cut = pos if boundary is None else boundary
+                parts.append(buf[start:cut])
+                buf = buf[cut:] + chunk
+                start = 0
+                pos -= cut
+                if boundary is not None:
+                    boundary = 0
+                    if split is not None:
+                        split -= cut
+            # tokens ending after `limit` may continue in the next chunk
+            limit = len(buf) if final else len(buf) - 4
+            while pos < limit:
+                if template:
+                    mo = cls._reTemplate.match(buf, pos)
+                    if mo is None:
+                        pos = len(buf) if final else pos
+                        break
+                    pos = mo.end()
+                    template = False
+                    if mo.group().endswith('${'):
+                        stack.append('${')
+                        last = ('punct', '${')
+                    else:
+                        last = ('value', '`')
+                    continue
+                mo = cls._reToken.match(buf, pos)
+                kind, text, end = mo.lastgroup, mo.group(), mo.end()
+                if end > limit:
+                    break
+                if kind in ('space', 'newline') or \
+                        (kind == 'comment' and text != '/*'):
+                    if kind == 'newline' and boundary is not None and \
+                            split is None:
+                        split = end
+                    pos = end
+                    continue
+                if kind == 'comment':
+                    close = buf.find('*/', end)
+                    if close < 0:
+                        pos = len(buf) if final else pos
+                        break
+                    pos = close + 2
+                    continue
+                if boundary is not None:
+                    if (kind != 'name' or text not in cls._joiningNames) \
+                            and (ender == ';' or kind == 'name'):
+                        at = split if lines else boundary
+                        if at is not None:
+                            yield ''.join(parts) + buf[start:at]
+                            parts = []
+                            start = at
+                    boundary = split = None
+                if kind == 'quote':
+                    if text == '`':
+                        template = True
+                        pos = end
+                        continue
+                    mo = cls._reString[text].match(buf, pos)
+                    if mo is None:
+                        pos = len(buf) if final else pos
+                        break
+                    pos = mo.end()
+                    last = ('value', text)
+                    continue
+                if kind == 'name':
+                    pos = end
+                    last = ('name', text)
+                    continue
+                if text[0] == '/' and cls._regExpAllowed(last):
+                    mo = cls._reRegExp.match(buf, pos)
+                    if mo is None and not final and \
+                            cls._reNewline.search(buf, pos) is None:
+                        break
+                    if mo is not None:
+                        if mo.end() > limit:
+                            break
+                        pos = mo.end()
+                        last = ('value', '/')
+                        continue
+                pos = end
+                last = ('punct', text)
+                if text in ('(', '[', '{'):
+                    stack.append(text)
+                elif text in cls._openers:
+                    if stack and stack[-1] in cls._openers[text]:
+                        if stack.pop() == '${':
+                            template = True
+                        elif not stack and text == '}':
+                            boundary, ender = end, text
+                elif text == ';' and not stack:
+                    boundary, ender = end, text
+        rest = ''.join(parts) + buf[start:]
+        if rest:
+            yield rest
+
+    @classmethod
+    def _reindentTokens(cls, js, indent=2):
+        """Re-indent `js` without parsing it, see `_reindentedLines`.
+        Leading and trailing blank lines are removed.
+
+        :param js:      javascript as unicode
+        :param indent:  width of indentation per level
+        :returns:       reindented javascript
+        :raises ValueError: if `js` is not balanced, see `_scanLines`
+
+        >>> from html5print import JSBeautifier
+        >>> js = '''if (a) { // check a
+        ... b(function() {
+        ...       return c +
+        ... d;  /* sum
+        ...   of both */
+        ...    });
+        ...   }'''
+        >>> print(JSBeautifier._reindentTokens(js))
+        if (a) { // check a
+          b(function() {
+            return c +
+              d;  /* sum
+                of both */
+          });
+        }
+        """
+        result = cls._reindentedLines(js, indent)
+        start, end = 0, len(result)
+        while start < end and not result[start]:
+            start += 1
+        while end > start and not result[end - 1]:
+            end -= 1
+        return '\n'.join(result[start:end])
+
     @classmethod
-    def beautify(cls, js, indent=2, encoding=None):
+    def _reindentedLines(cls, js, indent=2):
+        """Re-indent each line of `js` one level deeper than the line opening
+        the innermost bracket open at its start, and a line starting with
+        closing brackets as the line opening them.  Comments and the text of
+        each line are kept as is.  Lines within a template literal or a
+        string are not touched, and lines within a block comment are shifted
+        as much as the line the comment starts on.
+
+        :param js:      javascript as unicode
+        :param indent:  width of indentation per level
+        :returns:       list of reindented lines, one per line of `js`
+        :raises ValueError: if `js` is not balanced, see `_scanLines`
+        """
+        lines = cls._scanLines(js)
+        result = []
+        levels = []
+        shifts = []
+        for index, source in enumerate(cls._reNewline.split(js)):
+            line = lines[index]
+            mode = line['mode']
+            if line['closers']:
+                level = levels[line['closed']]
+            elif line['parent'] is None:
+                level = 0
+            else:
+                level = levels[line['parent']] + 1
+            if cls._isContinued(line):
+                level += 1
+            levels.append(level)
+            shift = 0
+            if mode == 'code':
+                text = source.lstrip()
+                if text:
+                    spaces = indent * level
+                    shift = spaces - (len(source) - len(text))
+                    source = ' ' * spaces + text
+            elif mode == 'comment':
+                shift = shifts[line['comment']]
+                if shift >= 0:
+                    source = ' ' * shift + source
+                else:
+                    spaces = len(source) - len(source.lstrip())
+                    source = source[min(-shift, spaces):]
+            shifts.append(shift)
+            if index + 1 == len(lines) or \
+                    lines[index + 1]['mode'] in ('code', 'comment'):
+                source = source.rstrip()
+            result.append(source)
+        return result
+
+    @classmethod
+    def beautify(cls, js, indent=2, encoding=None, cache=None, mode=None):
         """Prettifing `js` by reindending to width of indent per level. `js`
         is expected to be a valid Javascipt
 
@@ -69,6 +534,11 @@ class JSBeautifier(BeautifierBase):
         :param indent:   width od indentation per level
         :param encoding: expected encoding of `js`.  If None, it will be
                          guesssed
+        :param cache:    a `ResultCache` object to look up and store the
+                         result, None for no caching
+        :param mode:     one of `modes`, `mode` if None.  With "reindent",
+                         scripts with unbalanced brackets, strings or
+                         comments are formatted with "parse"
         :returns:        reindented javascript
 
         >>> from html5print import JSBeautifier
@@ -88,12 +558,104 @@ class JSBeautifier(BeautifierBase):
             document.getElementById("demo").innerHTML = "Paragraph changed.";
         }
 
+        >>> # comments are kept by mode reindent
+        >>> print(JSBeautifier.beautify('if (a) {\\nb(); // c\\n}',
+        ...                             mode='reindent'))
+        if (a) {
+          b(); // c
+        }
+
         """
-        parser = slimit.parser.Parser()
-        tree = parser.parse(decodeText(js))
+        mode = cls._checkMode(mode)
+        if cache is not None:
+            variant = None if mode == 'parse' else mode
+            return cls._cached(cache, js, indent, encoding,
+                               lambda: cls.beautify(js, indent, encoding,
+                                                    mode=mode),
+                               variant)
+        js = decodeText(js, encoding)
+        if mode == 'reindent':
+            try:
+                return cls._reindentTokens(js, indent)
+            except ValueError:
+                pass            # not balanced, left to the parser
+        tree = cls._parse(js)
         text = tree.to_ecma()
         return cls._reindenting(text, indent)
 
+    @classmethod
+    def _checkMode(cls, mode):
+        """Return `mode`, or the default `mode` if None.  Raise ValueError
+        if it is unknown"""
+        mode = mode or cls.mode
+        if mode not in cls.modes:
+            raise ValueError('Unknown mode {0!r}, expected one of '
+                             '{1}'.format(mode, ', '.join(cls.modes)))
+        return mode
+
+    @classmethod
+    def beautifyIter(cls, js, indent=2, encoding=None, mode=None):
+        """Prettify `js` like `beautify`, one top level statement at a time,
+        yielding each as soon as it is formatted.  `js` given in chunks is
+        never held in memory as a whole, only its longest statement is.
+        For a valid script, ``''.join(beautifyIter(js))`` is the same as
+        ``beautify(js)``; a statement is formatted with "parse" if it cannot
+        be re-indented, or with "reindent" mode the lines containing it.
+
+        :param js:       javascript as string, or an iterable of unicode
+                         chunks, e.g. from `utils.iterDecode`
+        :param indent:   width of indentation per level
+        :param encoding: expected encoding of `js` given as string.  If None,
+                         it will be guessed
+        :param mode:     one of `modes`, `mode` if None
+        :returns:        a generator of formatted statements, all but the
+                         first one start with a line feed
+
+        >>> from html5print import JSBeautifier
+        >>> chunks = ['var a = 1; function f() {', 'return a; }']
+        >>> for text in JSBeautifier.beautifyIter(chunks):
+        ...     print(text.strip())
+        var a = 1;
+        function f() {
+          return a;
+        }
+        """
+        mode = cls._checkMode(mode)
+        if isinstance(js, (bytes, type(''))):
+            js = [decodeText(js, encoding)]
+        if mode == 'reindent':
+            texts = cls._iterReindented(cls._iterStatements(js, True), indent)
+        else:
+            texts = cls._iterParsed(cls._iterStatements(js), indent)
+        return cls._joinTexts(texts, '\n')
+
+    @classmethod
+    def _iterParsed(cls, pieces, indent=2):
+        """Yield javascript `pieces` formatted with mode parse"""
+        for piece in pieces:
+            yield cls._reindenting(cls._parse(piece).to_ecma(), indent)
+
+    @classmethod
+    def _iterReindented(cls, pieces, indent=2):
+        """Yield javascript `pieces` of whole lines formatted with mode
+        "reindent", blank lines between them kept"""
+        blank = None            # blank lines after the last line yielded
+        for piece in pieces:
+            try:
+                lines = cls._reindentedLines(piece, indent)
+            except ValueError:
+                tree = cls._parse(piece)
+                lines = cls._reindenting(tree.to_ecma(), indent).split('\n')
+            else:
+                if piece.endswith(('\n', '\r')):
+                    lines.pop()         # the next piece starts this line
+            for line in lines:
+                if line:
+                    yield '\n' * (blank or 0) + line
+                    blank = 0
+                elif blank is not None:
+                    blank += 1
+
     @classmethod
     def beautifyTextInHTML(cls, html, indent=2, encoding=None):
         """Beautifying Javascript within the ``<script></script> tag``. HTML
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 Bernard Yue
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import unicode_literals, absolute_import
+
+import os
+import timeit
+import collections
+
+
+class Stats(object):
+    """Wall time, input and output sizes and number of calls of each stage
+    of a beautify call.  Sizes are in characters, or bytes for input not
+    yet decoded.  Stages of `HTMLBeautifier.beautify` are
+
+        - ``decode``: guessing encoding and decoding input
+        - ``parse``: building the parse tree
+        - ``serialize``: writing the tree, excluding embedded blocks
+        - ``js``: formatting embedded Javascript, one call per block
+        - ``css``: formatting embedded CSS, one call per block
+
+    :param callback: called as ``callback(stage, seconds, inSize, outSize)``
+                     for every record, None for no callback
+
+    >>> from html5print import HTMLBeautifier, Stats
+    >>> stats = Stats()
+    >>> html = '<style>p { color: red; }</style><script>var a=1</script>'
+    >>> output = HTMLBeautifier.beautify(html, stats=stats)
+    >>> [stage for stage in stats.stages if stats.records[stage]['calls']]
+    ['parse', 'serialize', 'js', 'css']
+    >>> stats.records['js']['calls'], stats.records['js']['inSize']
+    (1, 7)
+    """
+
+    stages = ('decode', 'parse', 'serialize', 'js', 'css')
+    timer = staticmethod(timeit.default_timer)
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.records = collections.OrderedDict(
+            (stage, self._newRecord()) for stage in self.stages)
+
+    @staticmethod
+    def _newRecord():
+        return dict(seconds=0.0, calls=0, inSize=0, outSize=0)
+
+    def add(self, stage, seconds, inSize=0, outSize=0):
+        """Record a call of `stage` taking `seconds`"""
+        record = self.records.get(stage)
+        if record is None:
+            record = self.records[stage] = self._newRecord()
+        record['seconds'] += seconds
+        record['calls'] += 1
+        record['inSize'] += inSize
+        record['outSize'] += outSize
+        if self.callback is not None:
+            self.callback(stage, seconds, inSize, outSize)
+
+    def seconds(self, stage):
+        """Return the time recorded for `stage`"""
+        record = self.records.get(stage)
+        return record['seconds'] if record else 0.0
+
+    @property
+    def total(self):
+        """time of all stages in seconds"""
+        return sum(r['seconds'] for r in self.records.values())
+
+    def wrap(self, stage, func):
+        """Return `func` recording each call as `stage`.  The size of the
+        first argument and of the result are recorded as input and output
+        size.
+
+        :param stage: name of the stage
+        :param func:  function taking text as first argument and returning
+                      text
+        :returns:     the wrapped function
+        """
+        def timed(text, *args, **kwargs):
+            start = self.timer()
+            result = func(text, *args, **kwargs)
+            self.add(stage, self.timer() - start, len(text), len(result))
+            return result
+        return timed
+
+    def timeIter(self, stage, iterable, exclude=()):
+        """Yield the items of `iterable`, recording the time spent producing
+        them as `stage`.  Time recorded meanwhile for stages in `exclude`,
+        e.g. by functions called by the iterator, is not counted twice.
+
+        :param stage:    name of the stage
+        :param iterable: iterable of text
+        :param exclude:  stages nested in `stage`
+        :returns:        a generator of the items of `iterable`
+        """
+        before = sum(self.seconds(s) for s in exclude)
+        it = iter(iterable)
+        seconds = 0.0
+        outSize = 0
+        while True:
+            start = self.timer()
+            try:
+                item = next(it)
+            except StopIteration:
+                seconds += self.timer() - start
+                break
+            seconds += self.timer() - start
+            outSize += len(item)
+            yield item
+        nested = sum(self.seconds(s) for s in exclude) - before
+        self.add(stage, seconds - nested, 0, outSize)
+
+    def report(self):
+        """Return the breakdown of time and sizes as a table
+
+        >>> stats = Stats()
+        >>> stats.add('parse', 0.5, 100, 0)
+        >>> stats.add('js', 0.25, 10, 12)
+        >>> stats.add('js', 0.25, 20, 24)
+        >>> print(stats.report())
+        stage           ms       %  calls    in size   out size
+        parse        500.0    50.0      1        100          0
+        js           500.0    50.0      2         30         36
+        total       1000.0   100.0
+        """
+        total = self.total
+        lines = ['{0:<9} {1:>8} {2:>7} {3:>6} {4:>10} {5:>10}'.format(
+                 'stage', 'ms', '%', 'calls', 'in size', 'out size')]
+        for stage, r in self.records.items():
+            if not r['calls']:
+                continue
+            lines.append('{0:<9} {1:>8.1f} {2:>7.1f} {3:>6} {4:>10} '
+                         '{5:>10}'.format(stage, r['seconds'] * 1000,
+                                          r['seconds'] * 100 / total
+                                          if total else 0.0,
+                                          r['calls'], r['inSize'],
+                                          r['outSize']))
+        lines.append('{0:<9} {1:>8.1f} {2:>7.1f}'.format(
+                     'total', total * 1000, 100.0 if total else 0.0))
+        return os.linesep.join(lines)
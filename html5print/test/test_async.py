@@ -0,0 +1,53 @@
+from __future__ import unicode_literals, absolute_import
+
+import pytest
+import os
+import sys
+
+asyncio = pytest.importorskip('asyncio')
+
+
+@pytest.fixture
+def beautifiers():
+    abspath = os.path.abspath('.')
+    sys.path.insert(0, abspath)
+    from html5print import HTMLBeautifier, CSSBeautifier, JSBeautifier
+    return HTMLBeautifier, CSSBeautifier, JSBeautifier
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+def test_abeautify(loop, beautifiers):
+    html, css, js = beautifiers
+    inputs = [(html, '<p>Some Text</p>'), (css, 'p{color:red}'),
+              (js, 'var a=1')]
+    futures = [cls.abeautify(text, 4, loop=loop) for cls, text in inputs]
+    got = loop.run_until_complete(asyncio.gather(*futures))
+    assert got == [cls.beautify(text, 4) for cls, text in inputs]
+
+
+def test_abeautify_executor(loop, beautifiers):
+    from concurrent.futures import ThreadPoolExecutor
+    html, css, js = beautifiers
+    executor = ThreadPoolExecutor(2)
+    try:
+        future = js.abeautify('var a=1', executor=executor, loop=loop)
+        assert loop.run_until_complete(future) == 'var a = 1;'
+        js.executor = executor
+        future = js.abeautify('var b=1', loop=loop)
+        assert loop.run_until_complete(future) == 'var b = 1;'
+    finally:
+        js.executor = None
+        executor.shutdown()
+
+
+def test_abeautify_error(loop, beautifiers):
+    html, css, js = beautifiers
+    with pytest.raises(ValueError):
+        loop.run_until_complete(html.abeautify('<p>', parser='nosuchparser',
+                                               loop=loop))
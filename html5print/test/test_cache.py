@@ -0,0 +1,79 @@
+from __future__ import unicode_literals, absolute_import
+
+import pytest
+import os
+
+
+@pytest.fixture
+def cache_class():
+    import sys
+    abspath = os.path.abspath('.')
+    sys.path.insert(0, abspath)
+    from html5print import ResultCache
+    return ResultCache
+
+
+@pytest.fixture
+def js_beautify():
+    import sys
+    abspath = os.path.abspath('.')
+    sys.path.insert(0, abspath)
+    from html5print import JSBeautifier
+    return JSBeautifier.beautify
+
+
+def test_cache_key(cache_class):
+    key = cache_class.makeKey('JSBeautifier', 'var a;', 2)
+    assert key == cache_class.makeKey('JSBeautifier', b'var a;', 2)
+    assert key != cache_class.makeKey('JSBeautifier', 'var a;', 4)
+    assert key != cache_class.makeKey('CSSBeautifier', 'var a;', 2)
+    assert key != cache_class.makeKey('JSBeautifier', 'var b;', 2)
+
+
+def test_memory_lru(cache_class):
+    cache = cache_class(maxsize=2)
+    cache.set('a', '1')
+    cache.set('b', '2')
+    assert cache.get('a') == '1'        # 'b' is now least recently used
+    cache.set('c', '3')
+    assert cache.get('b') is None
+    assert cache.get('a') == '1'
+    assert cache.stats == dict(hits=2, misses=1, size=2)
+
+
+def test_disk_store(tmpdir, cache_class, js_beautify):
+    directory = str(tmpdir.join('cache'))
+    cache = cache_class(directory=directory)
+    got = js_beautify('var a=1', cache=cache)
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    # a new cache object, e.g. in the next run, finds result on disk
+    cache = cache_class(directory=directory)
+    assert js_beautify('var a=1', cache=cache) == got
+    assert (cache.hits, cache.misses) == (1, 0)
+
+    cache.clear()
+    assert cache_class(directory=directory).get(
+        cache_class.makeKey('JSBeautifier', 'var a=1', 2)) is None
+
+
+def test_disk_eviction(tmpdir, cache_class):
+    directory = tmpdir.join('cache')
+    cache = cache_class(maxsize=1, directory=str(directory), maxDiskSize=250)
+    for i in range(10):
+        cache.set('{0:02d}key'.format(i), 'x' * 50)
+    size = sum(f.size() for f in directory.visit('*.txt'))
+    assert size <= 250
+    assert cache.get('09key') == 'x' * 50
+    assert cache.get('00key') is None
+
+
+def test_disk_overwrite(tmpdir, cache_class):
+    """overwriting an entry does not count its size twice"""
+    directory = tmpdir.join('cache')
+    cache = cache_class(maxsize=1, directory=str(directory), maxDiskSize=250)
+    cache.set('00key', 'x' * 50)
+    for i in range(10):
+        cache.set('01key', 'y' * 50)
+    assert cache._diskSize == 100
+    assert cache_class(directory=str(directory)).get('00key') == 'x' * 50
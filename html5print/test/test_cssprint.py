@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals, absolute_import
+
+import pytest
+import os
+import random
+
+
+@pytest.fixture
+def css_beautifier():
+    import sys
+    abspath = os.path.abspath('.')
+    sys.path.insert(0, abspath)
+    from html5print import CSSBeautifier
+    return CSSBeautifier
+
+
+@pytest.fixture
+def css_samples():
+    fixture = os.path.join(os.path.abspath('.'), 'html5print', 'test',
+                           'fixture')
+    samples = [
+        '/* head */ p { color: red; } /* between */ a:hover { b: c }',
+        '@media (min-width: 10px) { p { margin: 0; } /* c */ '
+        '@media print { a { b: c } } } q { d: e; }',
+        'p { content: "}{"; background: url(a}b.png) } a { b: \'{\' }',
+        'p { x: f(}) } a::after { content: "\\}" } \\} q { }',
+        'p { background: URL( "x}" ) } a { b: url(x\\)}) } c { d: e }',
+        '[x] { a: b } /* c */ p { d: e } } stray',
+        'p { a: b',
+    ]
+    for name in os.listdir(fixture):
+        if name.endswith('.css'):
+            with open(os.path.join(fixture, name), 'rb') as fh:
+                samples.append(fh.read().decode('utf-8', 'replace'))
+    return samples
+
+
+def split(text, rnd):
+    cuts = sorted(rnd.sample(range(len(text) + 1),
+                             min(len(text) + 1, rnd.randint(0, 8))))
+    return [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+
+
+def test_beautify_iter_chunks(css_beautifier, css_samples):
+    """output is the same however the input is split"""
+    rnd = random.Random(0)
+    for css in css_samples:
+        expected = css_beautifier.beautify(css, 4)
+        assert ''.join(css_beautifier.beautifyIter(css, 4)) == expected
+        for i in range(20):
+            chunks = split(css, rnd)
+            assert ''.join(css_beautifier._iterTopLevel(chunks)) == css
+            got = ''.join(css_beautifier.beautifyIter(chunks, 4))
+            assert got == expected
+
+
+def test_iter_top_level(css_beautifier):
+    chunks = ['p { content: "}', '" } a { background: url(', 'a}) }',
+              ' /* } */ b { c: "\\', '"}" } @media x { p { } } q']
+    pieces = list(css_beautifier._iterTopLevel(chunks))
+    assert pieces == ['p { content: "}" }', ' a { background: url(a}) }',
+                      ' /* } */ b { c: "\\"}" }', ' @media x { p { } }',
+                      ' q']
+
+
+def test_iter_top_level_large_block(css_beautifier):
+    """a top level block spanning many chunks is yielded whole"""
+    css = '@media x {' + 'p { a: "}" }\n' * 1000 + '} q { }'
+    chunks = [css[i:i + 7] for i in range(0, len(css), 7)]
+    pieces = list(css_beautifier._iterTopLevel(chunks))
+    assert pieces == [css[:-6], css[-6:]]
+
+
+def test_beautify_iter_incremental(css_beautifier):
+    """rules are yielded before the rest of the input is read"""
+    consumed = []
+
+    def chunks():
+        for i in range(1000):
+            consumed.append(i)
+            yield '.c{0} {{ margin: {0}px; }}\n'.format(i)
+
+    it = css_beautifier.beautifyIter(chunks())
+    assert next(it) == '.c0 {{{0}  margin              : 0px;{0}}}'.format(
+        os.linesep)
+    assert len(consumed) < 5
+    assert next(it).startswith(os.linesep + '.c1 {')
+
+
+def test_parser_flags(css_beautifier):
+    import tinycss2
+    from html5print import cssprint
+    assert cssprint.TINYCSS2_VERSION == \
+        css_beautifier._versionTuple(tinycss2.VERSION)
+    assert cssprint.PARSER_FLAGS == css_beautifier._tinycss2ParserFlag()
+    tinycss2.parse_component_value_list('p{}', **cssprint.PARSER_FLAGS)
+    if cssprint.STYLESHEET_FLAGS is not None:
+        rules = tinycss2.parse_stylesheet(' /* c */ p {} ',
+                                          **cssprint.STYLESHEET_FLAGS)
+        assert [r.type for r in rules] == ['comment', 'qualified-rule']
+
+
+def test_structured_engine(css_beautifier, css_samples):
+    css = ('@charset "utf-8"; /* head */ img { border\n:\n0 } '
+           '@font-face { font-family: a; src: url(a.woff) } '
+           'p { content: "a::b"; color: red !important; /* red */\n'
+           'margin: 0 } @media print { a:hover { b: c } }')
+    expected = os.linesep.join([
+        '@charset "utf-8";',
+        '/* head */',
+        'img {',
+        '  border              : 0;',
+        '}',
+        '@font-face {',
+        '  font-family         : a;',
+        '  src                 : url(a.woff);',
+        '}',
+        'p {',
+        '  content             : "a::b";',
+        '  color               : red !important; /* red */',
+        '  margin              : 0;',
+        '}',
+        '@media print {',
+        '  a:hover {',
+        '    b                   : c;',
+        '  }',
+        '}'])
+    assert css_beautifier.beautify(css, engine='structured') == expected
+    rnd = random.Random(0)
+    for css in css_samples:
+        expected = css_beautifier.beautify(css, 4, engine='structured')
+        for i in range(5):
+            got = ''.join(css_beautifier.beautifyIter(split(css, rnd), 4,
+                                                      engine='structured'))
+            assert got == expected
+
+
+def test_structured_engine_parse_error(css_beautifier):
+    """rules tinycss2 cannot parse are formatted with the tokens engine"""
+    css = 'p { a: b } q { a b; c: d } } stray'
+    got = css_beautifier.beautify(css, engine='structured')
+    tokens = css_beautifier.beautify('q { a b; c: d } } stray')
+    assert got == os.linesep.join(['p {', '  a                   : b;', '}',
+                                   tokens])
+
+
+def test_engine_option(css_beautifier, monkeypatch, tmpdir):
+    from html5print import ResultCache
+    css = 'p { a: b }'
+    with pytest.raises(ValueError):
+        css_beautifier.beautify(css, engine='nope')
+    structured = css_beautifier.beautify(css, engine='structured')
+    assert structured != css_beautifier.beautify(css)
+    cache = ResultCache(directory=str(tmpdir))
+    assert css_beautifier.beautify(css, cache=cache) != \
+        css_beautifier.beautify(css, cache=cache, engine='structured')
+    monkeypatch.setattr(css_beautifier, 'engine', 'structured')
+    assert css_beautifier.beautify(css) == structured
+
+
+def test_nested_at_rules(css_beautifier):
+    css = ('@supports (a: b) { /* one\ntwo */ @media print { } '
+           '@media x { p { c: d } } }')
+    expected = os.linesep.join([
+        '@supports (a: b) {',
+        '  /* one',
+        '  two */',
+        '  @media print {',
+        '  ',
+        '  }',
+        '  @media x {',
+        '    p {',
+        '      c                   : d',
+        '    }',
+        '  }',
+        '}'])
+    assert css_beautifier.beautify(css) == expected
+    depth = 1500                # deeper than the recursion limit
+    css = '@media x {' * depth + 'p { c: d }' + '}' * depth
+    lines = css_beautifier.beautify(css, 1).splitlines()
+    assert lines[depth] == ' ' * depth + 'p {'
+    lines = css_beautifier.beautify(css, 1, engine='structured').splitlines()
+    assert lines[depth + 1] == ' ' * (depth + 1) + 'c                   : d;'
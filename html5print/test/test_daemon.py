@@ -0,0 +1,117 @@
+from __future__ import unicode_literals, absolute_import
+
+import pytest
+import os
+import io
+import json
+import socket
+import threading
+
+
+@pytest.fixture
+def daemon_module():
+    import sys
+    abspath = os.path.abspath('.')
+    sys.path.insert(0, abspath)
+    from html5print import daemon
+    return daemon
+
+
+@pytest.fixture
+def socket_server(tmpdir, daemon_module):
+    if not hasattr(socket, 'AF_UNIX'):
+        pytest.skip('Unix sockets are not supported')
+    path = str(tmpdir.join('s.sock'))
+    server = daemon_module.Server()
+    thread = threading.Thread(target=server.serveSocket, args=(path,))
+    thread.start()
+    client = daemon_module.Client(path)
+    for i in range(100):
+        if client.isRunning():
+            break
+        threading.Event().wait(0.05)
+    yield client
+    if thread.is_alive():
+        client.shutdown()
+    thread.join()
+
+
+def test_handle_format(daemon_module):
+    server = daemon_module.Server()
+    response = server.handle(dict(id=1, method='format', params=dict(
+        filetype='css', payload='p{color:red}', indent=4)))
+    assert response['result'] == 'p {{{0}    color               : red' \
+        '{0}}}'.format(os.linesep).replace(os.linesep, '\n')
+
+
+def test_handle_errors(daemon_module):
+    server = daemon_module.Server()
+    codes = [json.loads(server.handleLine(line))['error']['code']
+             for line in ('{"id": 1, "method": "nope"}', 'not json',
+                          '[1]',
+                          '{"id": 1, "method": "format", "params": '
+                          '{"filetype": "xml", "payload": ""}}',
+                          '{"id": 1, "method": "format", "params": '
+                          '{"filetype": "js", "payload": "var ("}}')]
+    assert codes == [daemon_module.METHOD_NOT_FOUND,
+                     daemon_module.PARSE_ERROR,
+                     daemon_module.INVALID_REQUEST,
+                     daemon_module.INVALID_PARAMS,
+                     daemon_module.FORMAT_ERROR]
+    # notification, no response
+    assert server.handleLine('{"method": "ping"}') is None
+
+
+def test_serve_stream(daemon_module):
+    requests = [dict(jsonrpc='2.0', id=i, method='format',
+                     params=dict(filetype='js', payload='var a{0}=1'.format(i)))
+                for i in range(3)]
+    requests.append(dict(jsonrpc='2.0', id=3, method='shutdown'))
+    requests.append(dict(jsonrpc='2.0', id=4, method='ping'))
+    infile = io.BytesIO(''.join(json.dumps(r) + '\n'
+                                for r in requests).encode('utf-8'))
+    outfile = io.BytesIO()
+    daemon_module.Server().serveStream(infile, outfile)
+    responses = [json.loads(l) for l in outfile.getvalue().splitlines()]
+    assert [r['id'] for r in responses] == [0, 1, 2, 3]   # stopped at 3
+    assert responses[1]['result'] == 'var a1 = 1;'
+
+
+def test_socket_round_trip(socket_server):
+    data = 'p { content: "é"; }'.encode('latin-1')
+    got = socket_server.format('css', data, 2, 'latin-1')
+    assert 'é' in got
+    assert socket_server.format('js', 'var a=1') == 'var a = 1;'
+
+
+def test_client_not_running(tmpdir, daemon_module):
+    client = daemon_module.Client(str(tmpdir.join('none.sock')))
+    assert not client.isRunning()
+
+
+def test_socket_private(socket_server, daemon_module):
+    """the socket is accessible to the user only"""
+    assert daemon_module.isPrivate(socket_server.path)
+    os.chmod(socket_server.path, 0o666)
+    assert not daemon_module.isPrivate(socket_server.path)
+
+
+def test_default_socket_path(tmpdir, monkeypatch, daemon_module):
+    """without XDG_RUNTIME_DIR the socket is in a directory of the user"""
+    import tempfile
+    monkeypatch.delenv('XDG_RUNTIME_DIR', raising=False)
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmpdir))
+    path = daemon_module.defaultSocketPath()
+    assert os.path.dirname(os.path.dirname(path)) == str(tmpdir)
+
+
+def test_serve_socket_other_user(tmpdir, daemon_module):
+    """a socket path of another user is not removed"""
+    if not hasattr(os, 'getuid') or os.getuid() != 0:
+        pytest.skip('changing owner of a file requires root')
+    path = tmpdir.join('s.sock')
+    path.write('')
+    os.chown(str(path), 12345, -1)
+    with pytest.raises(daemon_module.DaemonError):
+        daemon_module.Server().serveSocket(str(path))
+    assert path.check()
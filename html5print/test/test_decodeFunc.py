@@ -118,3 +118,73 @@ def test_decodeText_utf32(decodeText_func, unicode_func):
     # incorrect encodeing given
     got = decodeText_func(data, 'utf-16')
     assert got == unicode_func('\u4eba\u751f')
+
+
+def test_decodeText_bom(decodeText_func, unicode_func):
+    """byte order mark decides encoding"""
+    data = '人生'
+    for encoding in ('utf-8-sig', 'utf-16', 'utf-32'):
+        got = decodeText_func(data.encode(encoding))
+        assert got == unicode_func(data), encoding
+
+
+def test_decodeText_declared(decodeText_func, unicode_func):
+    """<meta charset> and @charset are honoured"""
+    html = '<html><head><meta charset="gbk"></head><body>人生'
+    assert decodeText_func(html.encode('gbk')) == unicode_func(html)
+    css = '@charset "gb2312"; p:after { content: "人生"; }'
+    assert decodeText_func(css.encode('gbk')) == unicode_func(css)
+
+
+def test_decodeText_wrong_declaration(decodeText_func, unicode_func):
+    """declared charset which cannot decode text is ignored"""
+    html = '<meta charset="ascii">人生'
+    assert decodeText_func(html.encode('utf-8')) == unicode_func(html)
+
+
+def test_decodeText_large_undeclared(decodeText_func, fixture_dir):
+    """detection on a sample gives the same result as on whole text"""
+    filename = os.path.join(fixture_dir, 'unicode_sample.html')
+    with open(filename, 'rb') as fh:
+        data = fh.read().replace(b'charset=gb2312', b'')
+    got = decodeText_func(data * 20)
+    assert got[:len(got) // 20] == decodeText_func(data)
+
+
+@pytest.mark.parametrize('encoding', ['utf-8', 'utf-16', 'shift_jis'])
+def test_iterDecode_chunks(encoding):
+    """multibyte characters cut at chunk boundaries are decoded whole"""
+    from html5print.utils import iterDecode, DETECTION_SAMPLE_SIZE
+    text = '人生 is short, ' * (DETECTION_SAMPLE_SIZE // 8)
+    data = text.encode(encoding)
+    chunks = list(iterDecode(data, encoding, chunkSize=4097))
+    assert len(chunks) > 1
+    assert ''.join(chunks) == text
+
+
+def test_iterDecode_guess():
+    """without encoding, large data is decoded with the declared charset,
+    a wrong encoding given is disregarded"""
+    from html5print.utils import iterDecode, DETECTION_SAMPLE_SIZE
+    text = '<meta charset="latin-1"><p>halló</p>' * DETECTION_SAMPLE_SIZE
+    data = text.encode('latin-1')
+    assert ''.join(iterDecode(data)) == text
+    with pytest.warns(UserWarning):
+        assert ''.join(iterDecode(data, 'utf-8')) == text
+
+
+@pytest.mark.parametrize('size', [100, 3])
+def test_iterDecodeStream(size):
+    """chunks of any size decode as iterDecode decodes them joined"""
+    from html5print.utils import iterDecode, iterDecodeStream
+    from html5print.utils import DETECTION_SAMPLE_SIZE
+    text = '<meta charset="latin-1"><p>halló</p>' * (
+        DETECTION_SAMPLE_SIZE // 8)
+    data = text.encode('latin-1')
+    chunks = [data[i:i + size * 1024] for i in range(0, len(data),
+                                                     size * 1024)]
+    got = list(iterDecodeStream(iter(chunks)))
+    assert ''.join(got) == ''.join(iterDecode(data)) == text
+    assert len(got) > 1
+    small = '人生'.encode('utf-8')
+    assert ''.join(iterDecodeStream([small[:2], small[2:]])) == '人生'
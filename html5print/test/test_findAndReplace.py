@@ -0,0 +1,67 @@
+from __future__ import unicode_literals, absolute_import
+
+import pytest
+import os
+
+
+@pytest.fixture
+def js_beautify_in_html():
+    import sys
+    abspath = os.path.abspath('.')
+    sys.path.insert(0, abspath)
+    from html5print import JSBeautifier
+    return JSBeautifier.beautifyTextInHTML
+
+
+def test_many_scripts(js_beautify_in_html):
+    """every embedded script is formatted, in order"""
+    block = '  <script>var a{0}={0};</script>'
+    html = os.linesep.join(block.format(i) for i in range(200))
+    got = js_beautify_in_html(html)
+    expected = os.linesep.join('  <script>' + os.linesep +
+                               '    var a{0} = {0};</script>'.format(i)
+                               for i in range(200))
+    assert got == expected
+
+
+def test_script_text_in_attribute(js_beautify_in_html):
+    """script text also found in tag attribute is left untouched"""
+    html = '  <script data-x="x">x</script>'
+    got = js_beautify_in_html(html)
+    expected = '  <script data-x="x">' + os.linesep + '    x;</script>'
+    assert got == expected
+
+
+def test_blank_script(js_beautify_in_html):
+    """blank script is not formatted"""
+    html = '  <script src="a.js">  </script>'
+    assert js_beautify_in_html(html) == html
+
+
+@pytest.fixture
+def extract_comments():
+    import sys
+    abspath = os.path.abspath('.')
+    sys.path.insert(0, abspath)
+    from html5print.utils import BeautifierBase
+    return BeautifierBase._extractHTMLComments
+
+
+def test_extract_comments_positions(extract_comments):
+    """comments can be put back at the reported positions"""
+    script = ''.join('<!-- ad {0} -->var a{0};'.format(i) for i in range(500))
+    text, comments = extract_comments(script)
+    assert text == ''.join('var a{0};'.format(i) for i in range(500))
+    pieces, last = [], 0
+    for pos, comment in comments:
+        pieces.extend([text[last:pos], comment])
+        last = pos
+    pieces.append(text[last:])
+    assert ''.join(pieces) == script.replace(' -->', '-->')
+
+
+def test_extract_comments_malformed(extract_comments):
+    """unterminated comment is kept as text, nested end tags are dropped"""
+    assert extract_comments('a<!--b') == ('ab', [])
+    assert extract_comments('a<!--b-->c-->d') == ('ad', [(1, '<!--bc-->')])
+    assert extract_comments('') == ('', [])
@@ -74,3 +74,181 @@ def test_html_beautify_multiline_tag(html5_beautify, html_fragment):
     ''')
     expected = expected.replace('\n', '', 1)
     assert got == expected, 'Expected "{}", Got "{}"'.format(expected, got)
+
+
+@pytest.fixture
+def html5_beautify_iter():
+    import sys
+    abspath = os.path.abspath('.')
+    sys.path.insert(0, abspath)
+    from html5print import HTMLBeautifier
+    return HTMLBeautifier.beautifyIter
+
+
+def test_html_beautify_iter(html5_beautify_iter):
+    html = ('<title>T</title><style>p{color:red}</style>'
+            '<pre>  a\n  b</pre><script>var a=1</script>')
+    got = html5_beautify_iter(html)
+    assert not isinstance(got, (list, tuple))
+    expected = textwrap.dedent('''\
+    <html>
+      <head>
+        <title>
+          T
+        </title>
+        <style>
+          p {
+            color               : red
+          }
+        </style>
+      </head>
+      <body>
+        <pre>  a
+      b</pre>
+        <script>
+          var a = 1;
+        </script>
+      </body>
+    </html>
+    ''').replace('\\n', os.linesep)
+    assert ''.join(got) == expected
+
+
+def test_html_beautify_css_engine(html5_beautify):
+    """embedded css is formatted with the engine given"""
+    html = '<style>p { a: b }</style>'
+    assert 'a                   : b;' in html5_beautify(
+        html, cssEngine='structured')
+    assert 'a                   : b;' not in html5_beautify(html)
+
+
+def test_html_beautify_js_mode(html5_beautify):
+    """embedded javascript is formatted with the mode given"""
+    html = '<script>a(); // c</script>'
+    assert 'a(); // c' in html5_beautify(html, jsMode='reindent')
+    assert 'a(); // c' not in html5_beautify(html)
+
+
+def test_html_beautify_to(fixture_dir):
+    import io
+    from html5print import HTMLBeautifier
+    filename = os.path.join(fixture_dir, 'unicode_sample.html')
+    with open(filename, 'rb') as fh:
+        html = fh.read()
+    fh = io.StringIO()
+    HTMLBeautifier.beautifyTo(html, fh, 4)
+    assert fh.getvalue() == ''.join(HTMLBeautifier.beautifyIter(html, 4))
+    assert fh.getvalue().startswith('<!DOCTYPE html PUBLIC')
+
+
+@pytest.mark.parametrize('parser', ['html.parser', 'auto'])
+def test_html_beautify_parser(html5_beautify, parser):
+    """well-formed document gives the same result with any parser"""
+    html = ('<!DOCTYPE html><html><head><title>T</title></head>'
+            '<body><div><p>Some <b>Text</b></p><br></div></body></html>')
+    assert html5_beautify(html, parser=parser) == html5_beautify(html)
+
+
+def test_html_beautify_auto_repair(html5_beautify):
+    """fragment is repaired by html5lib in auto mode"""
+    html = '<title>T</title><ul><li>one<li>two</ul>'
+    assert html5_beautify(html, parser='auto') == html5_beautify(html)
+
+
+@pytest.mark.parametrize('body', [
+    '<table><tr><td>a</td></tr></table>',
+    '<table><tbody><tr><td>a</td><div>b</div></tr></tbody></table>',
+    '<table><div>a</div></table>',
+    '<table><tbody>a</tbody></table>',
+    '<table><col></table>',
+    '<form><form><input></form></form>',
+    '<svg viewBox="0 0 1 1"><path d="M0 0"/></svg>',
+    '<p><math definitionURL="u"><mi>x</mi></math></p>',
+])
+def test_html_beautify_auto_html5lib(html5_beautify, body):
+    """documents html5lib builds a different tree for are parsed by it in
+    auto mode"""
+    from html5print import HTMLBeautifier
+    html = '<html><head></head><body>{0}</body></html>'.format(body)
+    assert HTMLBeautifier._makeSoup(html, parser='auto').builder.NAME == \
+        'html5lib'
+    assert html5_beautify(html, parser='auto') == html5_beautify(html)
+    assert html5_beautify(html, parser='auto') != \
+        html5_beautify(html, parser='html.parser')
+
+
+@pytest.mark.parametrize('html', [
+    '<html><head><div>a</div></head><body></body></html>',
+    '<html><head></head>a<body></body></html>',
+    '<html><head></head><body></body></html><p>a</p>',
+    '<html><head></head><body></body></html>a',
+    '<html><head></head><body><h1><h2>a</h2></h1></body></html>',
+    '<html><head></head><body><button><button>a</button></button></body>'
+    '</html>',
+    '<html><head></head><body><ul><li><span><li>a</li></span></li></ul>'
+    '</body></html>',
+])
+def test_html_beautify_auto_document(html5_beautify, html):
+    """documents html5lib restructures outside of body, or by closing
+    elements implicitly, are parsed by it in auto mode"""
+    from html5print import HTMLBeautifier
+    assert HTMLBeautifier._makeSoup(html, parser='auto').builder.NAME == \
+        'html5lib'
+    assert html5_beautify(html, parser='auto') == html5_beautify(html)
+
+
+def test_html_beautify_auto_nested_list(html5_beautify):
+    """lists nested in list items are parsed by the fast parser"""
+    from html5print import HTMLBeautifier
+    html = ('<html><head><meta charset="utf-8"><title>T</title></head>'
+            '<body><ul><li><ul><li>a</li></ul></li></ul><h1>b</h1>'
+            '</body></html>')
+    assert HTMLBeautifier._makeSoup(html, parser='auto').builder.NAME != \
+        'html5lib'
+    assert html5_beautify(html, parser='auto') == html5_beautify(html)
+
+
+def test_html_beautify_auto_table(html5_beautify):
+    """complete tables are parsed by the fast parser in auto mode"""
+    from html5print import HTMLBeautifier
+    html = ('<html><head></head><body><table><caption>c</caption>'
+            '<colgroup><col></colgroup><thead><tr><th>a</th></tr></thead>'
+            '<tbody>\n<tr><td><form><div>b</div></form></td></tr></tbody>'
+            '</table></body></html>')
+    assert HTMLBeautifier._makeSoup(html, parser='auto').builder.NAME != \
+        'html5lib'
+    assert html5_beautify(html, parser='auto') == html5_beautify(html)
+
+
+def test_html_beautify_unknown_parser(html5_beautify):
+    with pytest.raises(ValueError):
+        html5_beautify('<p>x</p>', parser='nosuchparser')
+
+
+def test_html_beautify_stats(html5_beautify):
+    """stats record each stage without changing the result"""
+    from html5print import Stats
+    html = ('<style>p { color: red; }</style><style>b { color: red; }</style>'
+            '<script>var a=1</script><p>Some Text</p>')
+    calls = []
+    stats = Stats(callback=lambda *args: calls.append(args[0]))
+    got = html5_beautify(html, parser='auto', stats=stats)
+    assert got == html5_beautify(html)
+    assert calls == ['decode', 'parse', 'css', 'css', 'js', 'serialize']
+    records = stats.records
+    assert records['css']['calls'] == 2
+    assert records['js']['inSize'] == len('var a=1')
+    assert records['serialize']['outSize'] == len(got)
+    assert records['serialize']['seconds'] >= 0
+    assert abs(stats.total - sum(r['seconds'] for r in records.values())) \
+        < 1e-9
+
+
+def test_format_tag_old_bs4(html5_beautify):
+    """formatters of bs4 before 4.10 have no void_element_close_prefix"""
+    import bs4
+    from html5print import HTMLBeautifier
+    soup = bs4.BeautifulSoup('<br class="a">', 'html.parser')
+    formatter = bs4.formatter.HTMLFormatter()
+    del formatter.void_element_close_prefix
+    assert HTMLBeautifier._formatTag(soup.br, formatter) == '<br class="a"/>'
@@ -0,0 +1,54 @@
+from __future__ import unicode_literals, absolute_import
+
+import pytest
+import os
+import sys
+import subprocess
+
+
+HEAVY = ('bs4', 'html5lib', 'ply', 'slimit', 'chardet', 'cchardet',
+         'requests')
+
+
+def loaded_modules(code):
+    """run `code` in a fresh interpreter and return the set of top level
+    modules loaded after it"""
+    code += ('\nimport sys\n'
+             'print(" ".join(set(m.split(".")[0] for m in sys.modules)))')
+    out = subprocess.check_output([sys.executable, '-c', code],
+                                  cwd=os.path.abspath('.'))
+    return set(out.decode('utf-8').split())
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7),
+                    reason='lazy attributes require PEP 562')
+def test_import_package():
+    assert not loaded_modules('import html5print') & set(HEAVY)
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7),
+                    reason='lazy attributes require PEP 562')
+def test_import_css_beautifier():
+    loaded = loaded_modules('from html5print import CSSBeautifier\n'
+                            'CSSBeautifier.beautify("p { color: red; }")')
+    assert 'tinycss2' in loaded
+    assert not loaded & set(HEAVY + ('distutils',))
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7),
+                    reason='lazy attributes require PEP 562')
+def test_import_html_beautifier():
+    loaded = loaded_modules('from html5print import HTMLBeautifier')
+    assert not loaded & set(HEAVY)
+    loaded = loaded_modules('from html5print import HTMLBeautifier\n'
+                            'HTMLBeautifier.beautify("<p>x</p>")')
+    assert 'bs4' in loaded and 'html5lib' in loaded
+
+
+def test_lazy_attributes():
+    sys.path.insert(0, os.path.abspath('.'))
+    import html5print
+    assert 'JSBeautifier' in dir(html5print)
+    assert html5print.JSBeautifier.__name__ == 'JSBeautifier'
+    with pytest.raises(AttributeError):
+        html5print.NoSuchBeautifier
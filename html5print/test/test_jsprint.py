@@ -155,3 +155,146 @@ def test_html_beautify_multiline_tag(html5_beautify, html_fragment):
     expected = expected.replace('\n', '', 1)
     assert got == expected, 'Expected "{}", Got "{}"'.format(expected, got)
 """
+
+
+def test_js_beautify_after_syntax_error(js_beautify):
+    """a failed parse does not affect the next call on the same parser"""
+    with pytest.raises(SyntaxError):
+        js_beautify('var a = ;')
+    assert js_beautify('var a = 1\nvar b = 2') == 'var a = 1;\nvar b = 2;'
+
+
+def test_js_beautify_threads(js_beautify):
+    """parsers are not shared between threads"""
+    import threading
+    results = []
+
+    def worker(i):
+        for j in range(20):
+            results.append(js_beautify('var a{0} = {1};'.format(i, j)))
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    expected = ['var a{0} = {1};'.format(i, j)
+                for i in range(4) for j in range(20)]
+    assert sorted(results) == sorted(expected)
+
+
+def test_js_reindent_mode(js_beautify):
+    js = textwrap.dedent('''\
+    /* keep
+       me */
+    function f(a) {
+            var re = /[{(]/g, s = `${a.map(function(x) {
+      return x; }).join('}')}
+       text`;
+    if (a)
+    return a /
+    2; // half
+    return a +
+    1;
+      }''')
+    expected = textwrap.dedent('''\
+    /* keep
+       me */
+    function f(a) {
+      var re = /[{(]/g, s = `${a.map(function(x) {
+        return x; }).join('}')}
+       text`;
+      if (a)
+        return a /
+        2; // half
+      return a +
+        1;
+    }''')
+    assert js_beautify(js, mode='reindent') == expected
+
+
+def test_js_reindent_fallback(js_beautify, monkeypatch, tmpdir):
+    """unbalanced scripts are formatted by parsing them"""
+    import html5print
+    from html5print import ResultCache
+    js = 'var a = "}";\nif (a) { b(); }}'
+    with pytest.raises(ValueError):
+        html5print.JSBeautifier._reindentTokens(js)
+    with pytest.raises(SyntaxError):
+        js_beautify(js, mode='reindent')
+    js = 'var a = [1,\n2] // two'
+    assert js_beautify(js, mode='reindent') == 'var a = [1,\n  2] // two'
+    with pytest.raises(ValueError):
+        js_beautify(js, mode='nope')
+    cache = ResultCache(directory=str(tmpdir))
+    assert js_beautify(js, cache=cache) != \
+        js_beautify(js, cache=cache, mode='reindent')
+    monkeypatch.setattr(html5print.JSBeautifier, 'mode', 'reindent')
+    assert js_beautify(js) == 'var a = [1,\n  2] // two'
+
+
+def split(text, rnd):
+    cuts = sorted(rnd.sample(range(len(text) + 1),
+                             min(len(text) + 1, rnd.randint(0, 8))))
+    return [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+
+
+def test_js_beautify_iter(js_beautify, js_fragment):
+    """output is the same however the input is split"""
+    import random
+    from html5print import JSBeautifier
+    rnd = random.Random(0)
+    js = js_fragment + textwrap.dedent('''
+    if (a) b(); else c(); var r = /[;}]/g; // }
+    do { x(); } while (y);
+    try { a() } catch (e) { b("};") } finally { c() }
+
+    /* one; */ function f(s) { return s.split(';'); } f(r)
+    ''')
+    for mode in JSBeautifier.modes:
+        expected = js_beautify(js, 4, mode=mode)
+        assert ''.join(JSBeautifier.beautifyIter(js, 4, mode=mode)) == \
+            expected
+        for i in range(20):
+            chunks = split(js, rnd)
+            for lines in (False, True):
+                pieces = list(JSBeautifier._iterStatements(chunks, lines))
+                assert ''.join(pieces) == js
+            got = ''.join(JSBeautifier.beautifyIter(chunks, 4, mode=mode))
+            assert got == expected
+
+
+def test_iter_statements():
+    from html5print import JSBeautifier
+    js = ('x;\nif (a) b(); else c(); var r = /[;}]/g; // }\n'
+          'do { x(); } while (y);\n\n/* ; */ function f(s) { ret',
+          'urn "};"; } f(r)\n')
+    pieces = list(JSBeautifier._iterStatements(js))
+    assert pieces == ['x;', '\nif (a) b(); else c();', ' var r = /[;}]/g;',
+                      ' // }\ndo { x(); } while (y);',
+                      '\n\n/* ; */ function f(s) { return "};"; }',
+                      ' f(r)\n']
+    pieces = list(JSBeautifier._iterStatements(js, True))
+    assert pieces == ['x;\n',
+                      'if (a) b(); else c(); var r = /[;}]/g; // }\n',
+                      'do { x(); } while (y);\n',
+                      '\n/* ; */ function f(s) { return "};"; } f(r)\n']
+
+
+def test_js_beautify_iter_incremental():
+    """statements are yielded before the rest of the input is read"""
+    from html5print import JSBeautifier
+    consumed = []
+
+    def chunks():
+        for i in range(1000):
+            consumed.append(i)
+            yield 'function f{0}() {{ return {0}; }}\n'.format(i)
+
+    for mode, first in (('parse', 'function f0() {\n  return 0;\n}'),
+                        ('reindent', 'function f0() { return 0; }')):
+        del consumed[:]
+        it = JSBeautifier.beautifyIter(chunks(), mode=mode)
+        assert next(it) == first
+        assert len(consumed) < 5
+        assert next(it).startswith('\nfunction f1() {')
@@ -20,22 +20,37 @@ import os
 import sys
 import re
 import types
+import codecs
+import itertools
 import warnings
 
 
-try:
-    import chardet as cdetector
-except ImportError:
-    try:
-        import cchardet as cdetector
-    except ImportError:
-        print('Requires either chardet or cchardet module')
-        raise
+# byte order marks, utf-32 first as its little endian BOM begins with the
+# little endian BOM of utf-16
+BOMS = [(codecs.BOM_UTF32_LE, 'utf-32'), (codecs.BOM_UTF32_BE, 'utf-32'),
+        (codecs.BOM_UTF8, 'utf-8-sig'), (codecs.BOM_UTF16_LE, 'utf-16'),
+        (codecs.BOM_UTF16_BE, 'utf-16')]
+# <meta charset> or @charset is only looked for in the head of text
+DECLARATION_SAMPLE_SIZE = 4096
+# at most this many bytes are fed to chardet, in chunks
+DETECTION_SAMPLE_SIZE = 256 * 1024
+DETECTION_CHUNK_SIZE = 4096
+# bytes decoded at a time by `iterDecode`
+DECODE_CHUNK_SIZE = 1024 * 1024
+
+reDeclaredCharset = re.compile(
+    br'''<meta[^>]+?charset\s*=\s*["']?\s*([a-zA-Z0-9_.:-]+)'''
+    br'''|@charset\s+["']([a-zA-Z0-9_.:-]+)["']''', re.IGNORECASE)
+# labels of declared charset decoded with a superset, as browsers do
+CHARSET_SUPERSETS = {'gb2312': 'gbk', 'gb_2312-80': 'gbk'}
 
 
 def decodeText(text, encoding=None):
     """Decoding `text` to `encoding`.  If `encoding` is None, encoding
-    will be guessed.
+    will be guessed.  Guessing goes from the cheapest to the most expensive
+    check: byte order mark, ``<meta charset>`` or ``@charset``
+    declaration, strict utf-8 and finally chardet on a bounded sample of
+    `text`.
 
     **Note**: `encoding` provided will be disregarded if it causes decoding
     error
@@ -54,6 +69,9 @@ def decodeText(text, encoding=None):
     ...    unicode = str
     >>> isinstance(output, unicode)
     True
+
+    >>> print(decodeText(b'<meta charset="latin-1">hall\\xf3!'))
+    <meta charset="latin-1">halló!
     """
     # if `text` is unicode, not much to convert
     if isUnicode(text):
@@ -70,8 +88,18 @@ def decodeText(text, encoding=None):
             return text
 
     # no encoding or decoding with provided `encoding` failed
-    detected = cdetector.detect(text)
-    detectedEncoding = detected['encoding']
+    bom = _bomEncoding(text)
+    if bom:
+        return text.decode(bom, 'ignore')
+    for candidate in (_declaredEncoding(text), 'utf-8'):
+        if not candidate:
+            continue
+        try:
+            return text.decode(candidate, 'strict')
+        except UnicodeDecodeError:
+            pass
+
+    detectedEncoding = _chardetEncoding(text)
     encodingToUse = detectedEncoding
     if not detectedEncoding:
         # when all things failed, go 'utf-8' for now
@@ -86,6 +114,172 @@ def decodeText(text, encoding=None):
     return text
 
 
+def detectEncoding(data):
+    """Guess encoding of byte string `data` the way `decodeText` does, but
+    looking at a bounded sample only.  Use it when `data` is too large to be
+    decoded as a whole, e.g. for a memory mapped file.
+
+    :param data:  bytes, or an object supports slicing to bytes
+    :returns:     name of encoding
+
+    >>> from html5print.utils import detectEncoding
+    >>> detectEncoding(b'\\xef\\xbb\\xbfp { color: red; }')
+    'utf-8-sig'
+    >>> detectEncoding(b'@charset "ISO-8859-1"; p { color: red; }')
+    'ISO-8859-1'
+    >>> detectEncoding(b'p { color: red; }')
+    'utf-8'
+    """
+    head = data[:DETECTION_SAMPLE_SIZE]
+    encoding = _bomEncoding(head) or _declaredEncoding(head)
+    if encoding:
+        return encoding
+    try:
+        # a multibyte character may be cut at the end of sample
+        final = len(head) < DETECTION_SAMPLE_SIZE
+        codecs.getincrementaldecoder('utf-8')().decode(head, final)
+    except UnicodeDecodeError:
+        return _chardetEncoding(head) or 'utf-8'
+    return 'utf-8'
+
+
+def iterDecode(data, encoding=None, chunkSize=DECODE_CHUNK_SIZE):
+    """Decode byte string `data` in chunks of `chunkSize` bytes, so that
+    only one chunk of it is copied at a time, e.g. when `data` is a memory
+    mapped file.  `data` no larger than the sample of `detectEncoding` is
+    decoded as a whole by `decodeText`.  Otherwise `encoding` is used if
+    the sample decodes with it, else the encoding is guessed by
+    `detectEncoding`; bytes which cannot be decoded are dropped.
+
+    :param data:      bytes, or an object supports slicing to bytes
+    :param encoding:  encoding of `data`, guessed if None
+    :param chunkSize: number of bytes decoded at a time
+    :returns:         a generator of unicode chunks
+
+    >>> from html5print.utils import iterDecode
+    >>> print(''.join(iterDecode(b'@charset "latin-1"; p { x: "\\xe9"; }')))
+    @charset "latin-1"; p { x: "é"; }
+    """
+    if isUnicode(data):
+        yield data
+        return
+    if len(data) <= DETECTION_SAMPLE_SIZE:
+        yield decodeText(data[:], encoding)
+        return
+    decoder = codecs.getincrementaldecoder(
+        _sampleEncoding(data, encoding))('ignore')
+    for start in range(0, len(data), chunkSize):
+        chunk = decoder.decode(data[start:start + chunkSize])
+        if chunk:
+            yield chunk
+    chunk = decoder.decode(b'', True)
+    if chunk:
+        yield chunk
+
+
+def iterDecodeStream(chunks, encoding=None):
+    """Decode an iterable of byte `chunks`, e.g. a download, as the chunks
+    arrive.  Only the first `DETECTION_SAMPLE_SIZE` bytes are held back, to
+    choose the encoding the way `iterDecode` does; later chunks are decoded
+    one at a time.
+
+    :param chunks:    iterable of bytes
+    :param encoding:  encoding of the bytes, guessed if None
+    :returns:         a generator of unicode chunks
+
+    >>> from html5print.utils import iterDecodeStream
+    >>> print(''.join(iterDecodeStream([b'p { x: "\\xc3', b'\\xa9"; }'])))
+    p { x: "é"; }
+    """
+    chunks = iter(chunks)
+    head, size = [], 0
+    for chunk in chunks:
+        head.append(chunk)
+        size += len(chunk)
+        if size > DETECTION_SAMPLE_SIZE:
+            break
+    head = b''.join(head)
+    if size <= DETECTION_SAMPLE_SIZE:
+        # all of it arrived within the sample
+        for text in iterDecode(head, encoding):
+            yield text
+        return
+    decoder = codecs.getincrementaldecoder(
+        _sampleEncoding(head, encoding))('ignore')
+    for chunk in itertools.chain([head], chunks):
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b'', True)
+    if text:
+        yield text
+
+
+def _sampleEncoding(data, encoding=None):
+    """return `encoding` if the sample of `data` decodes with it, else the
+    encoding guessed by `detectEncoding`"""
+    if encoding:
+        try:
+            codecs.getincrementaldecoder(encoding)().decode(
+                data[:DETECTION_SAMPLE_SIZE])
+        except (LookupError, UnicodeDecodeError) as e:
+            warnings.warn(str(e))
+            encoding = None
+    return encoding or detectEncoding(data)
+
+
+def _bomEncoding(data):
+    """return encoding of `data` if it begins with a byte order mark, None
+    otherwise"""
+    for bom, encoding in BOMS:
+        if data[:len(bom)] == bom:
+            return encoding
+    return None
+
+
+def _declaredEncoding(data):
+    """return encoding declared by ``<meta charset>`` or ``@charset`` at
+    the beginning of `data`, None if not declared or unknown"""
+    mo = reDeclaredCharset.search(data[:DECLARATION_SAMPLE_SIZE])
+    if not mo:
+        return None
+    name = (mo.group(1) or mo.group(2)).decode('ascii')
+    try:
+        codecInfo = codecs.lookup(name)
+    except LookupError:
+        return None
+    if codecInfo.name.startswith(('utf-16', 'utf-32')):
+        # a document readable as ascii cannot be utf-16 or utf-32
+        return None
+    return CHARSET_SUPERSETS.get(name.lower(), name)
+
+
+def _chardetEncoding(data):
+    """return encoding detected by chardet from at most
+    DETECTION_SAMPLE_SIZE bytes of `data`, None if not detected.  The
+    detector is imported on first use only, most documents are decoded by
+    the cheaper tiers"""
+    try:
+        import chardet as cdetector
+    except ImportError:
+        try:
+            import cchardet as cdetector
+        except ImportError:
+            print('Requires either chardet or cchardet module')
+            raise
+    UniversalDetector = getattr(cdetector, 'UniversalDetector', None)
+    if UniversalDetector is None:
+        from chardet.universaldetector import UniversalDetector
+    detector = UniversalDetector()
+    end = min(len(data), DETECTION_SAMPLE_SIZE)
+    for start in range(0, end, DETECTION_CHUNK_SIZE):
+        detector.feed(data[start:min(start + DETECTION_CHUNK_SIZE, end)])
+        if detector.done:
+            break
+    detector.close()
+    return detector.result['encoding']
+
+
 def isUnicode(text):
     """Return True if `text` is unicode. False otherwise.  Note that because
     the function has to work on both Python 2 and Python 3, u'' cannot be used
@@ -129,42 +323,182 @@ class BeautifierBase(object):
                                   re.MULTILINE | re.DOTALL | re.IGNORECASE)
 
     @staticmethod
-    def _stripHTMLComments(text):
+    def _joinTexts(texts, separator=os.linesep):
+        """Yield non empty `texts`, all but the first one prefixed with
+        `separator`"""
+        prefix = ''
+        for text in texts:
+            if text:
+                yield prefix + text
+                prefix = separator
+
+    @classmethod
+    def _cached(cls, cache, text, indent, encoding, bfunc, variant=None):
+        """Return result of `bfunc()`, looked up in `cache` first.
+
+        :param cache:    a `ResultCache` object, or None for no caching
+        :param text:     input text, part of the cache key
+        :param indent:   width of indentation, part of the cache key
+        :param encoding: encoding of `text`, part of the cache key
+        :param bfunc:    function without argument that beautifies `text`
+        :param variant:  name of a non default formatting mode, part of the
+                         cache key
+        :returns:        beautified text
+        """
+        if cache is None:
+            return bfunc()
+        name = cls.__name__
+        if variant is not None:
+            name = '{0}:{1}'.format(name, variant)
+        key = cache.makeKey(name, text, indent, encoding)
+        result = cache.get(key)
+        if result is None:
+            result = bfunc()
+            cache.set(key, result)
+        return result
+
+    # executor of `abeautify`, None for the default executor of the loop
+    executor = None
+
+    @classmethod
+    def abeautify(cls, text, *args, **kwargs):
+        """Awaitable counterpart of `beautify`.  `beautify` is
+        thread-offloaded: it runs in an executor so that the event loop is
+        not blocked meanwhile.  Extra arguments are passed to `beautify`.
+        The executor is the one given as keyword argument, else the
+        `executor` class attribute, else the default executor of the loop.
+        Threads keep the loop responsive; a
+        `concurrent.futures.ProcessPoolExecutor` also formats in parallel,
+        but `cache` and `stats` are then not updated in this process.
+
+        :param text:     text to be beautified
+        :param executor: a `concurrent.futures.Executor`, keyword only
+        :param loop:     asyncio event loop, the running loop if None,
+                         keyword only
+        :returns:        an asyncio future of the beautified text
+        """
+        import asyncio
+        import functools
+        executor = kwargs.pop('executor', None) or cls.executor
+        # get_running_loop is new in python 3.7
+        loop = kwargs.pop('loop', None) or getattr(
+            asyncio, 'get_running_loop', asyncio.get_event_loop)()
+        return loop.run_in_executor(executor, functools.partial(
+            cls.beautify, text, *args, **kwargs))
+
+    @classmethod
+    def beautifyTo(cls, text, fileobj, *args, **kwargs):
+        """Beautify `text` with `beautifyIter` and write the result to
+        `fileobj` as it is produced.  Extra arguments are passed to
+        `beautifyIter`.
+
+        :param text:     text to be beautified
+        :param fileobj:  a file like object opened for writing unicode
+        :returns:        None
+        """
+        write = fileobj.write
+        for chunk in cls.beautifyIter(text, *args, **kwargs):
+            write(chunk)
+
+    @staticmethod
+    def _extractHTMLComments(text):
+        """Take HTML comments '<!-- ... -->' out of `text` in a single pass,
+        collecting the remaining text in a list.  A comment without end tag
+        is kept as text, less its '<!--'.
+
+        :param text: text to scan
+        :returns:    a tuple with the following fields
+                       - text with comment(s) removed
+                       - list of (position, comment), `position` is the
+                         offset in the text without comments where the
+                         comment was removed
+
+        >>> text, comments = BeautifierBase._extractHTMLComments(
+        ...     'a = 1;<!-- one  -->b = 2;<!--two-->')
+        >>> print(text)
+        a = 1;b = 2;
+        >>> for pos, comment in comments:
+        ...     print('{0} {1}'.format(pos, comment))
+        6 <!-- one-->
+        12 <!--two-->
+        """
+        fragments = text.split('<!--')
+        pieces = [fragments[0]]
+        length = len(fragments[0])
+        comments = []
+        for f in fragments[1:]:
+            tmp = f.split('-->')
+            if len(tmp) == 2:
+                # this is the correct case
+                comments.append((length, '<!--' + tmp[0].rstrip() + '-->'))
+            elif len(tmp) > 2:
+                # maybe invalid nested comment, take maximum chunk as comment
+                comments.append((length, '<!--' + ''.join(tmp[:-1]) + '-->'))
+            # else found comment with no endtag, keep as text
+            pieces.append(tmp[-1])
+            length += len(tmp[-1])
+        return ''.join(pieces), comments
+
+    @classmethod
+    def _stripHTMLComments(cls, text):
         """Removing HTML Comments '<!-- ... -->' out of `text`
         :returns: a tuple with the following fields
                     - text with comment(s) removed
                     - removed comment(s)
         """
-        textWithoutComments = ''
-        comments = []
-        sep = ('<!--', '-->')
-        fragments = text.split(sep[0])
-        if len(fragments) == 1:
-            textWithoutComments = fragments[0]
-        else:
-            textWithoutComments += fragments[0]
-            for f in fragments[1:]:
-                tmp = f.split(sep[-1])
-                if len(tmp) == 1:
-                    # found comment with no endtag ...
-                    # ignore for now
-                    textWithoutComments += tmp[0]
-                elif len(tmp) == 2:
-                    # this is the correct case
-                    textWithoutComments += tmp[-1]
-                    comments.append(sep[0] + tmp[0].rstrip() + sep[-1])
-                else:
-                    # this should never happen (maybe invalid
-                    # nested comment)
-                    # for this we take maximum chunk as comment
-                    textWithoutComments += tmp[-1]
-                    comments.append(sep[0] + ''.join(tmp[:-1]) + sep[-1])
-        return (textWithoutComments, os.linesep.join(comments))
+        text, comments = cls._extractHTMLComments(text)
+        return (text, os.linesep.join(c for pos, c in comments))
+
+    @classmethod
+    def _formatSection(cls, spaces, script, bfunc, bfuncArgs, indent=2):
+        """Beautify an embedded `script` with `bfunc` and indent the result
+        one level deeper than `spaces`.  HTML comments within `script` are
+        moved to the end of the section.
+
+        :param spaces:    leading whitespace of the enclosing tag
+        :param script:    text requires formatting
+        :param bfunc:     beautifying function, see `_findAndReplace`
+        :param bfuncArgs: tuple of extra arguments for `bfunc`
+        :param indent:    width of indentation
+        :returns:         formatted section, lines joined with os.linesep
+        """
+        thisIndent = ' ' * (len(spaces) + indent)
+        newScript, comments = cls._stripHTMLComments(script)
+        params = (newScript,) + tuple(bfuncArgs)
+        lines = [thisIndent + l for l in bfunc(*params).splitlines()]
+        lines.extend([thisIndent + l for l in comments.splitlines()])
+        return os.linesep.join(lines)
+
+    @staticmethod
+    def _splice(text, replacements):
+        """Build a new string from `text` with spans replaced in a single
+        pass.
+
+        :param text:         original text
+        :param replacements: iterable of (start, end, newText), ordered by
+                             `start` and not overlapping
+        :returns:            text with every span replaced
+
+        >>> print(BeautifierBase._splice('abcdef', [(1, 2, 'X'), (4, 6, '')]))
+        aXcd
+        """
+        pieces = []
+        last = 0
+        for start, end, newText in replacements:
+            pieces.append(text[last:start])
+            pieces.append(newText)
+            last = end
+        if not pieces:
+            return text
+        pieces.append(text[last:])
+        return ''.join(pieces)
 
     @classmethod
     def _findAndReplace(cls, text, regExp, bfunc, bfuncArgs, indent=2):
         """Find and replace `text` with what returned by `regExp` by
-        beautifing function `bfunc` and params `bfuncArgs`.
+        beautifing function `bfunc` and params `bfuncArgs`.  All matches are
+        collected in one scan and the result is built with a single join, so
+        the cost is linear to the size of `text`.
 
         :param text:      text to be find and replace
         :param regExp:    regular expression that returns a list of pairs of
@@ -179,27 +513,13 @@ class BeautifierBase(object):
                           beautifing
         :returns:         beautified text
         """
-        final = text
-        sections = []
-        marker = '%%__mark__%%'
-        matches = regExp.finditer(text)
-        if matches:
-            adjustment = 0
-            for mo in matches:
-                spaces, script = mo.groups()
-                if not script.strip():
-                    continue
-                start, end = mo.span()
-                start += adjustment
-                thisIndent = ' ' * (len(spaces) + indent)
-                newScript, comments = cls._stripHTMLComments(script)
-                params = (newScript,) + bfuncArgs
-                lines = [thisIndent + l for l in bfunc(*params).splitlines()]
-                lines.extend([thisIndent + l for l in comments.splitlines()])
-                sections.append(os.linesep.join(lines))
-                final = final[:start] + final[start:].replace(
-                    script, marker, 1)
-                adjustment += len(marker) - len(script)
-        for s in sections:
-            final = final.replace(marker, os.linesep + s, 1)
-        return final
+        replacements = []
+        for mo in regExp.finditer(text):
+            spaces, script = mo.groups()
+            if not script.strip():
+                continue
+            section = cls._formatSection(spaces, script, bfunc, bfuncArgs,
+                                         indent)
+            start, end = mo.span(2)
+            replacements.append((start, end, os.linesep + section))
+        return cls._splice(text, replacements)
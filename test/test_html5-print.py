@@ -1,6 +1,7 @@
 from __future__ import unicode_literals
 
 import pytest
+import os
 
 
 @pytest.fixture
@@ -90,3 +91,382 @@ def test_beautify_from_files_with_encoding(tmpdir, script_object, data_files):
 
 
 
+
+
+def test_beautify_with_parser(tmpdir, script_object, data_files):
+    """This test is assume to be passed if no exception raised"""
+    for file, ftype in data_files:
+        if ftype != 'html':
+            continue
+        outfile = str(tmpdir.join('null'))
+        script_object.process(ftype, file, outfile, 2, None, 'auto')
+
+
+def test_guess_filetype(script_object):
+    assert script_object.guessFiletype('a/b.CSS') == 'css'
+    assert script_object.guessFiletype('http://x.com/a.js?v=1') == 'js'
+    assert script_object.guessFiletype('page.htm') == 'html'
+    assert script_object.guessFiletype('README') == 'html'
+
+
+def test_collect_files(tmpdir, script_object):
+    src = tmpdir.mkdir('src')
+    src.join('a.css').write('p { color: red; }')
+    src.mkdir('sub').join('b.js').write('var a = 1;')
+    src.join('notes.txt').write('not formatted')
+    outdir = str(tmpdir.join('out'))
+    got = script_object.collectFiles([str(src)], True, outdir)
+    expected = [(str(src.join('a.css')), os.path.join(outdir, 'a.css')),
+                (str(src.join('sub', 'b.js')),
+                 os.path.join(outdir, 'sub', 'b.js'))]
+    assert got == expected
+    got = script_object.collectFiles([str(src.join('*.css'))], False, '',
+                                     True)
+    assert got == [(str(src.join('a.css')), str(src.join('a.css')))]
+
+
+def test_collect_files_mirrored(tmpdir, script_object):
+    """files of the same name in different directories do not collide"""
+    src = tmpdir.mkdir('src')
+    src.join('a.css').write('p { color: red; }')
+    src.mkdir('sub').join('a.css').write('p { color: blue; }')
+    outdir = str(tmpdir.join('out'))
+    infiles = [str(src.join('a.css')), str(src.join('sub', 'a.css'))]
+    got = script_object.collectFiles(infiles, False, outdir)
+    assert got == [(infiles[0], os.path.join(outdir, 'a.css')),
+                   (infiles[1], os.path.join(outdir, 'sub', 'a.css'))]
+    with pytest.raises(ValueError):
+        script_object.collectFiles([infiles[1], str(src.join('sub'))], True,
+                                   outdir)
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_process_batch(tmpdir, script_object, workers):
+    """bad file is reported, others are still formatted"""
+    src = tmpdir.mkdir('src')
+    src.join('a.css').write('p { color: red; }')
+    src.join('bad.js').write('var = ;')
+    src.join('c.js').write('var a=1')
+    outdir = tmpdir.join('out')
+    files = script_object.collectFiles([str(src)], True, str(outdir))
+    jobs = [(script_object.guessFiletype(i), i, o, 2, None, 'html5lib')
+            for i, o in files]
+    errors = script_object.processBatch(jobs, workers)
+    assert [e[0] for e in errors] == [str(src.join('bad.js'))]
+    assert outdir.join('c.js').read() == 'var a = 1;' + os.linesep
+    assert outdir.join('a.css').check()
+    assert not outdir.join('bad.js').check()
+
+
+def test_forward_to_daemon(tmpdir, script_object):
+    """files are formatted by a running server, and locally without one"""
+    import socket
+    import threading
+    from html5print import daemon
+    if not hasattr(socket, 'AF_UNIX'):
+        pytest.skip('Unix sockets are not supported')
+    infile = tmpdir.join('a.js')
+    infile.write('var a=1')
+    path = str(tmpdir.join('s.sock'))
+    assert script_object.daemonClient(path) is None
+
+    server = daemon.Server()
+    thread = threading.Thread(target=server.serveSocket, args=(path,))
+    thread.start()
+    try:
+        client = daemon.Client(path)
+        while not client.isRunning():
+            threading.Event().wait(0.05)
+        outfile = str(tmpdir.join('a.out.js'))
+        script_object.process('js', str(infile), outfile, 2, None,
+                              socketPath=path)
+        assert server.caches[None].misses == 1      # formatted by server
+
+        # a server of another version is not used
+        server.ping = lambda: '0.0.0'
+        assert script_object.daemonClient(path) is None
+    finally:
+        client.shutdown()
+        thread.join()
+    assert open(outfile).read() == 'var a = 1;' + os.linesep
+
+
+@pytest.mark.parametrize('jobs,forwarded', [('1', True), ('2', False)])
+def test_run_batch_forwarding(tmpdir, monkeypatch, script_object, jobs,
+                              forwarded):
+    """parallel batches are formatted by the workers, not by a server"""
+    import sys
+    tmpdir.join('a.css').write('p{color:red}')
+    tmpdir.join('b.css').write('p{color:red}')
+    socketPath = str(tmpdir.join('s.sock'))
+    batches = []
+    monkeypatch.setattr(script_object, 'processBatch',
+                        lambda jobs, *args: batches.append(jobs) or [])
+    monkeypatch.setattr(sys, 'argv', [
+        'html5-print', '-j', jobs, '--socket', socketPath, '-o',
+        str(tmpdir.join('out')), str(tmpdir.join('a.css')),
+        str(tmpdir.join('b.css'))])
+    script_object.run()
+    assert [job[7] == socketPath for job in batches[0]] == [forwarded] * 2
+
+
+def test_profile(tmpdir, capsys, script_object):
+    infile = tmpdir.join('a.html')
+    infile.write('<style>p{color:red}</style><script>var a=1</script>')
+    outfile = str(tmpdir.join('b.html'))
+    script_object.process('html', str(infile), outfile, 2, None,
+                          profile=True)
+    err = capsys.readouterr()[1]
+    stages = [l.split()[0] for l in err.splitlines()[2:]]
+    assert stages == ['decode', 'parse', 'serialize', 'js', 'css', 'total']
+    assert open(outfile).read().startswith('<html>')
+
+
+def test_aprocess(tmpdir, script_object):
+    """files are read and formatted concurrently in an event loop"""
+    asyncio = pytest.importorskip('asyncio')
+    loop = asyncio.new_event_loop()
+    try:
+        futures = []
+        for i in range(3):
+            infile = tmpdir.join('{0}.js'.format(i))
+            infile.write('var a{0}=1'.format(i))
+            futures.append(script_object.aprocess(
+                'js', str(infile), str(tmpdir.join('{0}.out'.format(i))),
+                2, None, loop=loop))
+        futures.append(script_object.aread(str(infile), loop=loop))
+        futures.append(script_object.aprocess(
+            'js', str(infile), str(tmpdir.join('b.out')), 4, None,
+            profile=True, loop=loop))
+        infile = tmpdir.join('c.js')
+        infile.write('if(a){\nb()}')
+        futures.append(script_object.aprocess(
+            'js', str(infile), str(tmpdir.join('c.out')), 4, None,
+            jsMode='reindent', loop=loop))
+        results = loop.run_until_complete(asyncio.gather(*futures))
+    finally:
+        loop.close()
+    assert results[3] == b'var a2=1'
+    for i in range(3):
+        assert tmpdir.join('{0}.out'.format(i)).read() == \
+            'var a{0} = 1;{1}'.format(i, os.linesep)
+    assert tmpdir.join('b.out').read() == 'var a2 = 1;' + os.linesep
+    assert tmpdir.join('c.out').read() == \
+        'if(a){{\n    b()}}{0}'.format(os.linesep)
+
+
+@pytest.fixture
+def http_server():
+    """local http server of a few pages, counting connections"""
+    import threading
+    try:
+        from http.server import HTTPServer, BaseHTTPRequestHandler
+        from socketserver import ThreadingMixIn
+    except ImportError:
+        from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+        from SocketServer import ThreadingMixIn
+
+    pages = {
+        '/latin.html': ('text/html; charset=ISO-8859-1',
+                        '<p>caf\xe9 cr\xe8me</p>'.encode('latin-1')),
+        '/dir/': ('text/html', b'<p>index</p>'),
+        '/style.css': ('text/css', b'p{color:red}'),
+        '/app.js?v=1': ('application/javascript', b'var a=1'),
+    }
+    for i in range(6):
+        pages['/p{0}.html'.format(i)] = ('text/html; charset=utf-8',
+                                         '<p>{0}</p>'.format(i).encode())
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def setup(self):
+            BaseHTTPRequestHandler.setup(self)
+            with self.server.lock:
+                self.server.connections += 1
+
+        def do_GET(self):
+            if self.path not in pages:
+                self.send_error(404)
+                return
+            contentType, body = pages[self.path]
+            self.send_response(200)
+            self.send_header('Content-Type', contentType)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+    server = Server(('127.0.0.1', 0), Handler)
+    server.lock = threading.Lock()
+    server.connections = 0
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    server.url = 'http://127.0.0.1:{0}'.format(server.server_address[1])
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_charset_from_content_type():
+    import script
+    assert script.charsetFromContentType('text/html; charset="UTF-8"') == \
+        'UTF-8'
+    assert script.charsetFromContentType('text/html') is None
+    assert script.charsetFromContentType('text/html; charset=nope') is None
+    assert script.charsetFromContentType(None) is None
+
+
+def test_url_output_name(script_object):
+    name = script_object.urlOutputName
+    assert name('http://a.com') == os.path.join('a.com', 'index.html')
+    assert name('http://a.com/x/') == os.path.join('a.com', 'x',
+                                                   'index.html')
+    assert name('http://a.com:80/../b.js?v=1&w') == \
+        os.path.join('a.com_80', 'b_v_1_w.js')
+    files = script_object.collectFiles(['http://a.com/', 'http://a.com'],
+                                       outdir='out')
+    assert [f[1] for f in files] == [
+        os.path.join('out', 'a.com', 'index.html'),
+        os.path.join('out', 'a.com', 'index-1.html')]
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_process_urls(tmpdir, script_object, http_server, workers):
+    """urls are fetched over pooled connections, Content-Type charset is
+    used, failed downloads are reported"""
+    paths = ['/latin.html', '/dir/', '/style.css', '/app.js?v=1',
+             '/missing.html'] + ['/p{0}.html'.format(i) for i in range(6)]
+    urls = [http_server.url + p for p in paths]
+    outdir = tmpdir.join('out')
+    jobs = [(script_object.guessFiletype(i), i, o, 2, None, 'html5lib')
+            for i, o in script_object.collectFiles(urls, outdir=str(outdir))]
+    errors = script_object.processBatch(jobs, workers, connections=2)
+    assert [e[0] for e in errors] == [urls[4]]
+    assert 'HTTPError' in errors[0][1]
+    host = outdir.join('127.0.0.1_{0}'.format(
+        http_server.server_address[1]))
+    assert 'caf&eacute; cr&egrave;me' in host.join('latin.html').read()
+    assert script_object.fetch(urls[0])[1] == 'ISO-8859-1'
+    outfile = tmpdir.join('latin.html')
+    script_object.process('html', urls[0], str(outfile), 2, None)
+    assert outfile.read() == host.join('latin.html').read()
+    assert 'index' in host.join('dir', 'index.html').read()
+    assert host.join('style.css').read() == \
+        'p {{{0}  color               : red{0}}}{0}'.format(os.linesep)
+    assert host.join('app_v_1.js').read() == 'var a = 1;' + os.linesep
+    assert http_server.connections < len(urls)
+
+
+def test_run_url_with_query(monkeypatch, capsys, script_object,
+                            http_server):
+    """a url with a query string is one input, not a glob"""
+    import sys
+    url = http_server.url + '/app.js?v=1'
+    monkeypatch.setattr(sys, 'argv', ['html5-print', '--no-daemon', url])
+    script_object.run()
+    assert capsys.readouterr()[0] == 'var a = 1;' + os.linesep
+
+
+def test_run_glob_characters(tmpdir, monkeypatch, capsys, script_object):
+    """an existing file is not a glob, a glob matching nothing fails"""
+    import sys
+    infile = tmpdir.join('x[1].css')
+    infile.write('p{color:red}')
+    monkeypatch.setattr(sys, 'argv', ['html5-print', '--no-daemon',
+                                      str(infile)])
+    script_object.run()
+    assert capsys.readouterr()[0].startswith('p {')
+    outdir = tmpdir.join('out')
+    monkeypatch.setattr(sys, 'argv', ['html5-print', '--no-daemon',
+                                      str(infile), str(tmpdir.join('*.js')),
+                                      '-o', str(outdir)])
+    with pytest.raises(SystemExit) as e:
+        script_object.run()
+    assert 'no file matches' in str(e.value.code)
+    assert not outdir.check()
+
+
+def test_process_mapped_file(tmpdir, script_object):
+    """large file is memory mapped and decoded in chunks, also in place"""
+    text = 'p { content: "é"; }\n' * 20000
+    infile = tmpdir.join('a.css')
+    infile.write_binary(('@charset "latin-1";\n' + text).encode('latin-1'))
+    mapped = script_object.mapFile(str(infile))
+    assert mapped is not None and len(mapped) > 256 * 1024
+    mapped.close()
+    assert script_object.mapFile('-') is None
+
+    expected = script_object.beautifyCSS(
+        '@charset "latin-1";\n' + text) + os.linesep
+    outfile = tmpdir.join('b.css')
+    script_object.process('css', str(infile), str(outfile), 2, None)
+    assert outfile.read_text('utf-8') == expected
+    script_object.process('css', str(infile), str(infile), 2, None)
+    assert infile.read_text('utf-8') == expected
+
+
+def test_css_engine(tmpdir, script_object):
+    """css files and css embedded in html are formatted with --css-engine"""
+    import html5print
+    infile = tmpdir.join('a.css')
+    infile.write('img { border: 0 }')
+    outfile = tmpdir.join('b.css')
+    script_object.process('css', str(infile), str(outfile), 2, None,
+                          cssEngine='structured')
+    assert outfile.read() == \
+        'img {{{0}  border              : 0;{0}}}{0}'.format(os.linesep)
+    infile = tmpdir.join('a.html')
+    infile.write('<style>img { border: 0 }</style>')
+    outfile = tmpdir.join('b.html')
+    script_object.process('html', str(infile), str(outfile), 2, None,
+                          cssEngine='structured')
+    assert 'border              : 0;' in outfile.read()
+    assert html5print.CSSBeautifier.engine == 'tokens'
+
+
+def test_js_mode(tmpdir, script_object):
+    """js files and js embedded in html are formatted with --js-mode"""
+    import html5print
+    infile = tmpdir.join('a.js')
+    infile.write('if (a) {\nb(); // c\n}')
+    outfile = tmpdir.join('b.js')
+    script_object.process('js', str(infile), str(outfile), 2, None,
+                          jsMode='reindent')
+    assert outfile.read() == 'if (a) {{{0}  b(); // c{0}}}{0}'.format(
+        os.linesep)
+    infile = tmpdir.join('a.html')
+    infile.write('<script>if (a) {\nb(); // c\n}</script>')
+    outfile = tmpdir.join('b.html')
+    script_object.process('html', str(infile), str(outfile), 2, None,
+                          jsMode='reindent')
+    assert 'b(); // c' in outfile.read()
+    assert html5print.JSBeautifier.mode == 'parse'
+
+
+def test_process_js_streamed(tmpdir, script_object):
+    """javascript is formatted one statement at a time, also in place"""
+    text = 'var a = "é";\nfunction f() { return a; }\n' * 1000
+    infile = tmpdir.join('a.js')
+    infile.write_binary(text.encode('utf-8'))
+    chunks = [text[:1000], text[1000:]]
+    lines = script_object.beautifyChunks('js', chunks)
+    assert next(iter(lines)) == 'var a = "é";'
+    expected = script_object.beautifyJS(text) + os.linesep
+    outfile = tmpdir.join('b.js')
+    script_object.process('js', str(infile), str(outfile), 2, None)
+    assert outfile.read_text('utf-8') == expected
+    script_object.process('js', str(infile), str(infile), 2, None)
+    assert infile.read_text('utf-8') == expected
+    bad = text + 'var = ;\n'
+    infile.write_binary(bad.encode('utf-8'))
+    with pytest.raises(SyntaxError):
+        script_object.process('js', str(infile), str(infile), 2, None)
+    assert infile.read_text('utf-8') == bad
+    assert sorted(tmpdir.listdir()) == [infile, outfile]